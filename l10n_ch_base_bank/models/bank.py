@@ -1,12 +1,27 @@
 # Copyright 2012-2019 Camptocamp
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+import logging
 import re
-from odoo import models, fields, api, _
-from odoo.tools import mod10r
-from odoo.exceptions import ValidationError
+
+import psycopg2
+
+from odoo import models, fields, api, tools, _
+from odoo.tools import split_every
+from odoo.addons.base.models.res_bank import sanitize_account_number
+from odoo.addons.base_iban.models.res_partner_bank import (
+    _map_iban_template,
+    validate_iban,
+)
+from ..tools import postal
+from odoo.exceptions import UserError, ValidationError
+from odoo.osv import expression
+
+_logger = logging.getLogger(__name__)
 
 CH_POSTFINANCE_CLEARING = "09000"
 CH_POST_BIC = 'POFICHBEXXX'
+# countries of the IBAN holding a swiss clearing number
+CH_CLEARING_COUNTRIES = ('CH', 'LI')
 
 
 def validate_l10n_ch_postal(postal_acc_number):
@@ -16,35 +31,35 @@ def validate_l10n_ch_postal(postal_acc_number):
     is also accepted.
     Raise a ValidationError if check fails
     """
-    if not postal_acc_number:
+    error = postal.parse(postal_acc_number).error
+    if error == postal.MISSING:
         raise ValidationError(_("There is no postal account number."))
-    if re.match('^[0-9]{2}-[0-9]{1,6}-[0-9]$', postal_acc_number):
-        ref_subparts = postal_acc_number.split('-')
-        postal_acc_number = (
-            ref_subparts[0] + ref_subparts[1].rjust(6, '0') + ref_subparts[2]
-        )
-
-    if not re.match(r'\d{9}$', postal_acc_number or ''):
+    elif error == postal.BAD_FORMAT:
         msg = _("The postal does not match 9 digits position.")
         raise ValidationError(msg)
-
-    acc_number_without_check = postal_acc_number[:-1]
-    if not mod10r(acc_number_without_check) == postal_acc_number:
+    elif error == postal.BAD_CHECKSUM:
         raise ValidationError(_("The postal account number is not valid."))
 
 
 def pretty_l10n_ch_postal(number):
     """format a postal account number or an ISR subscription number
     as per specifications with '-' separators.
-    eg. 010000628 -> 01-162-8
+    eg. 010001628 -> 01-162-8
     """
-    if re.match('^[0-9]{2}-[0-9]{1,6}-[0-9]$', number or ''):
-        return number
-    currency_code = number[:2]
-    middle_part = number[2:-1]
-    trailing_cipher = number[-1]
-    middle_part = re.sub('^0*', '', middle_part)
-    return currency_code + '-' + middle_part + '-' + trailing_cipher
+    return postal.parse(number).pretty
+
+
+def _is_iban_format(number):
+    """Tell if an account number has the country and the length of an
+    IBAN, whatever its checksum"""
+    number = sanitize_account_number(number) or ''
+    template = _map_iban_template.get(number[:2].lower())
+    return bool(template) and len(number) == len(template.replace(' ', ''))
+
+
+def _escape_like(value):
+    """Escape the wildcards of a value searched with like"""
+    return re.sub(r'([\\%_])', r'\\\1', value)
 
 
 def _is_l10n_ch_postfinance_iban(iban):
@@ -78,9 +93,102 @@ class Bank(models.Model):
         readonly=True,
     )
 
+    # columns looked up by name_search
+    _name_search_columns = ('code', 'bic', 'name', 'street', 'city')
+    # fields changing the index of the banks, the name sets their order
+    _bank_index_fields = ('clearing', 'bic', 'active', 'name')
+
     def is_swiss_post(self):
         return self.bic == CH_POST_BIC
 
+    @api.model
+    @tools.ormcache()
+    def _get_bank_index(self):
+        """Return the ids of the active banks by clearing and by BIC
+
+        Built once and kept in the registry cache, it is cleared when
+        banks are created, modified or deleted. When several banks share
+        a clearing or a BIC, the first one found by `search` is kept.
+
+        :return: dicts {clearing: id} and {bic: id}
+        :rtype: tuple
+        """
+        by_clearing = {}
+        by_bic = {}
+        banks = self.sudo().search_read([], ['clearing', 'bic'])
+        for bank in banks:
+            if bank['clearing']:
+                by_clearing.setdefault(bank['clearing'], bank['id'])
+            if bank['bic']:
+                by_bic.setdefault(bank['bic'].upper(), bank['id'])
+        return by_clearing, by_bic
+
+    @api.model
+    def _get_by_clearing(self, clearing):
+        """Return the bank of a clearing number, from the index
+
+        :rtype: res.bank record, empty if not found
+        """
+        bank_id = self._get_bank_index()[0].get(clearing)
+        return self.browse(bank_id or [])
+
+    @api.model
+    def _get_by_bic(self, bic):
+        """Return the bank of a BIC, from the index
+
+        :rtype: res.bank record, empty if not found
+        """
+        bank_id = self._get_bank_index()[1].get((bic or '').upper())
+        return self.browse(bank_id or [])
+
+    @api.model
+    def resolve_many(self, ibans):
+        """Find the banks of IBAN numbers by their clearing number
+
+        Only the swiss and liechtenstein IBAN hold a clearing number, the
+        other ones are not resolved.
+
+        :param ibans: IBAN numbers, formatted or not
+        :type ibans: iterable of str
+
+        :return: bank of each IBAN, empty record if not found
+        :rtype: dict {iban: res.bank record}
+        """
+        by_clearing = self._get_bank_index()[0]
+        bank_ids = {}
+        for iban in ibans:
+            sanitized = sanitize_account_number(iban) or ''
+            bank_ids[iban] = (
+                by_clearing.get(sanitized[4:9])
+                if sanitized[:2] in CH_CLEARING_COUNTRIES else None
+            )
+        # share the prefetching of all the found banks
+        banks = self.browse(
+            list({bank_id for bank_id in bank_ids.values() if bank_id})
+        )
+        return {iban: self.browse(bank_id or [], prefetch=banks._prefetch)
+                for iban, bank_id in bank_ids.items()}
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        banks = super().create(vals_list)
+        # once for all the banks, as when loading the banks of l10n_ch_bank
+        self._get_bank_index.clear_cache(self)
+        return banks
+
+    @api.multi
+    def write(self, vals):
+        res = super().write(vals)
+        if any(field in vals for field in self._bank_index_fields):
+            self._get_bank_index.clear_cache(self)
+        return res
+
+    @api.multi
+    def unlink(self):
+        res = super().unlink()
+        self._get_bank_index.clear_cache(self)
+        return res
+
     @api.multi
     def name_get(self):
         """Format displayed name"""
@@ -93,34 +201,73 @@ class Bank(models.Model):
 
     @api.model
     def name_search(self, name, args=None, operator='ilike', limit=80):
-        """Extends to look on bank code, bic, name, street and city"""
+        """Extends to look on bank code, bic, name, street and city
+
+        Each word of the searched name is looked for in all the columns,
+        the banks matching the most words come first.
+        """
         if args is None:
             args = []
-        ids = []
-        cols = ('code', 'bic', 'name', 'street', 'city')
-        if name:
-            for val in name.split(' '):
-                for col in cols:
-                    tmp_ids = self.search(
-                        [(col, 'ilike', val)] + args,
-                        limit=limit
-                    )
-                    if tmp_ids:
-                        ids += tmp_ids.ids
-                        break
-        else:
-            ids = self.search(
-                args,
-                limit=limit
-            ).ids
-        # we sort by occurrence
-        to_ret_ids = list(set(ids))
-        to_ret_ids = sorted(
-            to_ret_ids,
-            key=lambda x: ids.count(x),
-            reverse=True
+        tokens = name.split() if name else []
+        if not tokens or operator in expression.NEGATIVE_TERM_OPERATORS:
+            return super().name_search(
+                name, args=args, operator=operator, limit=limit)
+        self.check_access_rights('read')
+        query = self._where_calc(args)
+        self._apply_ir_rules(query, 'read')
+        order_by = self._generate_order_by_inner(
+            self._table, self._order, query)
+        from_clause, where_clause, where_params = query.get_sql()
+        # the banks having a column like the word
+        match = '(%s)' % ' OR '.join(
+            '"%s"."%s" ILIKE %%s' % (self._table, column)
+            for column in self._name_search_columns
+        )
+        match_params = []
+        for token in tokens:
+            pattern = '%%%s%%' % _escape_like(token)
+            match_params += [pattern] * len(self._name_search_columns)
+        score = ' + '.join(
+            'CASE WHEN %s THEN 1 ELSE 0 END' % match for __ in tokens
+        )
+        query_str = """
+            SELECT "{table}".id, {score} AS score
+            FROM {from_clause}
+            WHERE {where_clause} ({matches})
+            ORDER BY score DESC, {order_by}
+        """.format(
+            table=self._table,
+            score=score,
+            from_clause=from_clause,
+            where_clause=where_clause + ' AND' if where_clause else '',
+            matches=' OR '.join(match for __ in tokens),
+            order_by=', '.join(order_by),
+        )
+        params = match_params + where_params + match_params
+        if limit:
+            query_str += ' LIMIT %s'
+            params.append(limit)
+        self.env.cr.execute(query_str, params)
+        ids = [row[0] for row in self.env.cr.fetchall()]
+        return self.browse(ids).name_get()
+
+    @api.model_cr
+    def init(self):
+        # trigram indexes for the like searches of name_search, the
+        # extension can only be created by a superuser of the database
+        self.env.cr.execute(
+            "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
         )
-        return self.browse(to_ret_ids).name_get()
+        if not self.env.cr.fetchone():
+            _logger.info('Extension pg_trgm is not installed, banks are '
+                         'searched without trigram index')
+            return
+        for column in self._name_search_columns:
+            self.env.cr.execute(
+                'CREATE INDEX IF NOT EXISTS "{table}_{column}_trgm_index" '
+                'ON "{table}" USING gin ("{column}" gin_trgm_ops)'.format(
+                    table=self._table, column=column)
+            )
 
 
 class FutureResPartnerBank(models.Model):
@@ -183,17 +330,18 @@ class FutureResPartnerBank(models.Model):
                 pass
         return None
 
-    @api.model
-    def create(self, vals):
-        if vals.get('l10n_ch_postal'):
-            try:
-                validate_l10n_ch_postal(vals['l10n_ch_postal'])
-                vals['l10n_ch_postal'] = pretty_l10n_ch_postal(
-                    vals['l10n_ch_postal']
-                )
-            except ValidationError:
-                pass
-        return super().create(vals)
+    @api.model_create_multi
+    def create(self, vals_list):
+        for vals in vals_list:
+            if vals.get('l10n_ch_postal'):
+                try:
+                    validate_l10n_ch_postal(vals['l10n_ch_postal'])
+                    vals['l10n_ch_postal'] = pretty_l10n_ch_postal(
+                        vals['l10n_ch_postal']
+                    )
+                except ValidationError:
+                    pass
+        return super().create(vals_list)
 
     def write(self, vals):
         if vals.get('l10n_ch_postal'):
@@ -238,6 +386,9 @@ class ResPartnerBank(models.Model):
     """
     _inherit = 'res.partner.bank'
 
+    # number of accounts created at once by import_rows
+    _import_chunk_size = 1000
+
     @api.onchange('acc_number')
     def onchange_acc_number_set_swiss_bank(self):
         """ Deduce information from IBAN
@@ -299,44 +450,264 @@ class ResPartnerBank(models.Model):
     @api.model
     def _compute_name_from_postal_number(self, partner_name, postal_number):
         """This method makes sure to generate a unique name"""
+        return self._compute_names_from_postal_numbers(
+            [(partner_name, postal_number)])[0]
+
+    @api.model
+    def _get_postal_base_name(self, partner_name, postal_number):
+        """Return the account name of a postal number, before any suffix
+        making it unique"""
         if partner_name and postal_number:
-            acc_name = _("{}/Postal number {}").format(
+            return _("{}/Postal number {}").format(
                 partner_name,
                 postal_number
             )
         elif postal_number:
-            acc_name = _("Postal number {}").format(postal_number)
-        else:
-            return ''
-
-        exist_count = self.env['res.partner.bank'].search_count(
-            [('acc_number', '=like', acc_name)])
-        # if acc_number not unique iterate on bank_accounts while not get
-        # unique number
-        if exist_count:
-            name_exist = exist_count
-            while name_exist:
-                new_name = acc_name + " #{}".format(exist_count)
-                name_exist = self.env['res.partner.bank'].search_count(
-                    [('acc_number', '=', new_name)])
-                exist_count += 1
-            acc_name = new_name
-        return acc_name
+            return _("Postal number {}").format(postal_number)
+        return ''
 
     @api.model
-    def create(self, vals):
+    def _get_used_postal_name_suffixes(self, base_names):
+        """Return the suffixes already used by the accounts named after
+        the given names, the name without suffix being 0 and " #N" being N
+
+        :rtype: dict {base name: set of int}
+        """
+        used = {name: set() for name in base_names}
+        for names in split_every(500, list(used)):
+            domain = expression.OR(
+                ['|', ('acc_number', '=', name),
+                 ('acc_number', '=like', _escape_like(name) + ' #%')]
+                for name in names
+            )
+            accounts = self.search_read(domain, ['acc_number'])
+            for account in accounts:
+                acc_number = account['acc_number']
+                if acc_number in used:
+                    used[acc_number].add(0)
+                    continue
+                name, __, suffix = acc_number.rpartition(' #')
+                if name in used and suffix.isdigit():
+                    used[name].add(int(suffix))
+        return used
+
+    @api.model
+    def _compute_names_from_postal_numbers(self, partner_postals):
+        """Generate unique account names for many postal numbers
+
+        The names already used are read once, each name gets the smallest
+        free " #N" suffix when it is already used, including by a previous
+        name of the batch.
+
+        :param partner_postals: partner names and postal numbers
+        :type partner_postals: list of tuple
+
+        :rtype: list of str
+        """
+        base_names = [self._get_postal_base_name(partner_name, number)
+                      for partner_name, number in partner_postals]
+        used = self._get_used_postal_name_suffixes(
+            {name for name in base_names if name})
+        acc_names = []
+        for base_name in base_names:
+            if not base_name:
+                acc_names.append('')
+                continue
+            suffixes = used[base_name]
+            suffix = 0
+            while suffix in suffixes:
+                suffix += 1
+            suffixes.add(suffix)
+            acc_names.append(
+                base_name + " #{}".format(suffix) if suffix else base_name)
+        return acc_names
+
+    @api.model_create_multi
+    def create(self, vals_list):
         """
         acc_number is mandatory for model, but in localization it could be not
         mandatory when we have postal number, so we compute acc_number in
         onchange methods and check it here also
         """
-        if not vals.get('acc_number') and vals.get('l10n_ch_postal'):
-            partner = self.env['res.partner'].browse(vals.get('partner_id'))
-            vals['acc_number'] = self._compute_name_from_postal_number(
-                partner.name,
-                vals['l10n_ch_postal']
+        to_name = [
+            vals for vals in vals_list
+            if not vals.get('acc_number') and vals.get('l10n_ch_postal')
+        ]
+        if to_name:
+            partners = self.env['res.partner'].browse(
+                list({vals.get('partner_id') for vals in to_name
+                      if vals.get('partner_id')}))
+            partner_names = {partner.id: partner.name for partner in partners}
+            acc_names = self._compute_names_from_postal_numbers([
+                (partner_names.get(vals.get('partner_id')),
+                 vals['l10n_ch_postal'])
+                for vals in to_name
+            ])
+            for vals, acc_name in zip(to_name, acc_names):
+                vals['acc_number'] = acc_name
+        return super().create(vals_list)
+
+    @api.model
+    def import_rows(self, rows):
+        """Validate and create many bank accounts at once
+
+        The rows are normalized and validated together, as the onchange
+        methods would do: account type, IBAN checksum, postal number
+        checksum, bank found by the clearing of the swiss IBAN, unique
+        account number. A row in error does not prevent the creation of
+        the other ones, which are created by batches.
+
+        :param rows: values of each account, as given to `create`
+        :type rows: list of dict
+
+        :return: created accounts, and error message by index of the rows
+                 which are not imported
+        :rtype: tuple
+        """
+        vals_by_index, errors = self._prepare_import_rows(rows)
+        account_ids = []
+        for chunk in split_every(self._import_chunk_size,
+                                 sorted(vals_by_index.items())):
+            chunk_ids, chunk_errors = self._create_import_chunk(chunk)
+            account_ids += chunk_ids
+            errors.update(chunk_errors)
+        return self.browse(account_ids), errors
+
+    @api.model
+    def _prepare_import_rows(self, rows):
+        """Normalize and validate the rows given to `import_rows`
+
+        :return: values to create and error messages, by index of row
+        :rtype: tuple of dict
+        """
+        errors = {}
+        prepared = {}
+        # parsed account numbers which are valid postal numbers
+        postal_acc_numbers = {}
+        for index, row in enumerate(rows):
+            vals = dict(row)
+            acc_number = (vals.get('acc_number') or '').strip()
+            postal_number = (vals.get('l10n_ch_postal') or '').strip()
+            if not vals.get('partner_id'):
+                errors[index] = _("The partner is missing.")
+                continue
+            if not acc_number and not postal_number:
+                errors[index] = _("The account number is missing.")
+                continue
+            if postal_number:
+                try:
+                    validate_l10n_ch_postal(postal_number)
+                except ValidationError as err:
+                    errors[index] = err.name
+                    continue
+                postal_number = pretty_l10n_ch_postal(postal_number)
+            if acc_number and postal.parse(acc_number).valid:
+                postal_acc_numbers[index] = postal.parse(acc_number)
+            vals['acc_number'] = acc_number
+            vals['l10n_ch_postal'] = postal_number
+            prepared[index] = vals
+
+        post_bank = self.env['res.bank']._get_by_bic(CH_POST_BIC)
+        ibans = {}
+        for index, vals in prepared.items():
+            if index in errors:
+                continue
+            acc_number = vals['acc_number']
+            if index in postal_acc_numbers:
+                vals['l10n_ch_postal'] = (vals['l10n_ch_postal'] or
+                                          postal_acc_numbers[index].pretty)
+                if post_bank and vals.get('bank_id') == post_bank.id:
+                    vals['acc_number'] = vals['l10n_ch_postal']
+                else:
+                    # named after the partner and the postal number
+                    vals['acc_number'] = ''
+            elif acc_number:
+                try:
+                    validate_iban(acc_number)
+                    ibans[index] = acc_number
+                except ValidationError as err:
+                    if _is_iban_format(acc_number):
+                        errors[index] = err.name
+        # banks of all the IBAN at once
+        banks = self.env['res.bank'].resolve_many(set(ibans.values()))
+        for index, iban in ibans.items():
+            vals = prepared[index]
+            if not vals.get('bank_id') and banks[iban]:
+                vals['bank_id'] = banks[iban].id
+            if not vals['l10n_ch_postal']:
+                vals['l10n_ch_postal'] = self._retrieve_l10n_ch_postal(
+                    sanitize_account_number(iban)) or ''
+        self._check_import_duplicates(prepared, errors)
+
+        vals_by_index = {}
+        for index, vals in prepared.items():
+            if index in errors:
+                continue
+            vals['l10n_ch_postal'] = vals['l10n_ch_postal'] or False
+            vals_by_index[index] = vals
+        return vals_by_index, errors
+
+    @api.model
+    def _check_import_duplicates(self, prepared, errors):
+        """Report the rows having the number of an existing account, or of
+        a previous row, in the same company"""
+        default_company_id = self.env.user.company_id.id
+        keys = {}
+        for index, vals in prepared.items():
+            if index in errors or not vals['acc_number']:
+                continue
+            keys[index] = (sanitize_account_number(vals['acc_number']),
+                           vals.get('company_id') or default_company_id)
+        existing = set()
+        numbers = list({number for number, __ in keys.values()})
+        for chunk in split_every(self._import_chunk_size, numbers):
+            accounts = self.search_read(
+                [('sanitized_acc_number', 'in', list(chunk))],
+                ['sanitized_acc_number', 'company_id'],
+            )
+            existing.update(
+                (account['sanitized_acc_number'],
+                 account['company_id'] and account['company_id'][0])
+                for account in accounts
             )
-        return super().create(vals)
+        for index in sorted(keys):
+            if keys[index] in existing:
+                errors[index] = _("The account number %s already exists.") % (
+                    prepared[index]['acc_number'])
+            existing.add(keys[index])
+
+    @api.model
+    def _create_import_chunk(self, chunk):
+        """Create a batch of accounts of `import_rows`
+
+        When the batch cannot be created, the accounts are created one by
+        one to find the rows in error.
+
+        :param chunk: index of the row and values of each account
+        :type chunk: sequence of tuple
+
+        :return: ids of the created accounts, and error message by index
+                 of row
+        :rtype: tuple
+        """
+        try:
+            with self.env.cr.savepoint():
+                accounts = self.create([dict(vals) for __, vals in chunk])
+            return accounts.ids, {}
+        except (UserError, ValidationError, psycopg2.Error):
+            _logger.info('Bank accounts import: batch of %d accounts in '
+                         'error, created one by one', len(chunk))
+        account_ids = []
+        errors = {}
+        for index, vals in chunk:
+            try:
+                with self.env.cr.savepoint():
+                    account_ids.append(self.create(dict(vals)).id)
+            except (UserError, ValidationError) as err:
+                errors[index] = err.name
+            except psycopg2.Error as err:
+                errors[index] = err.pgerror or str(err)
+        return account_ids, errors
 
     @api.multi
     def _get_ch_bank_from_iban(self):
@@ -344,8 +715,7 @@ class ResPartnerBank(models.Model):
         if self.acc_type != 'iban' and self.acc_number[:2] != 'CH':
             return False
         clearing = self.sanitized_acc_number[4:9]
-        return clearing and self.env['res.bank'].search(
-            [('clearing', '=', clearing)], limit=1)
+        return clearing and self.env['res.bank']._get_by_clearing(clearing)
 
     @api.onchange('l10n_ch_postal')
     def onchange_l10n_ch_postal_set_acc_number(self):
@@ -1,16 +1,69 @@
 # Copyright 2012-2019 Camptocamp
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+import logging
 import re
 
-from odoo import models, api, _
-from odoo.tools import mod10r
+from odoo import models, fields, api, _
+from odoo.osv import expression
+from odoo.tools import sql
+from ..tools.checksum import mod10r
 from odoo import exceptions
 
+_logger = logging.getLogger(__name__)
+
 
 class AccountInvoice(models.Model):
 
     _inherit = "account.invoice"
 
+    reference_compact = fields.Char(
+        string='Reference without spaces',
+        compute='_compute_reference_compact',
+        store=True,
+        index=True,
+        help='Used to search invoices by reference regardless of spaces',
+    )
+
+    @api.depends('reference')
+    def _compute_reference_compact(self):
+        for invoice in self:
+            invoice.reference_compact = (
+                invoice.reference.replace(' ', '') if invoice.reference
+                else False
+            )
+
+    @api.model_cr_context
+    def _auto_init(self):
+        # fill the column of existing invoices at once, instead of letting
+        # the ORM compute it invoice by invoice
+        if not sql.column_exists(self.env.cr, self._table,
+                                 'reference_compact'):
+            sql.create_column(self.env.cr, self._table, 'reference_compact',
+                              'varchar')
+            self.env.cr.execute(
+                "UPDATE account_invoice "
+                "SET reference_compact = REPLACE(reference, ' ', '') "
+                "WHERE reference IS NOT NULL"
+            )
+        return super()._auto_init()
+
+    @api.model_cr
+    def init(self):
+        # trigram index for the like searches on the reference, the
+        # extension can only be created by a superuser of the database
+        self.env.cr.execute(
+            "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+        )
+        if not self.env.cr.fetchone():
+            _logger.info('Extension pg_trgm is not installed, invoice '
+                         'references are searched without trigram index')
+            return
+        self.env.cr.execute(
+            "CREATE INDEX IF NOT EXISTS "
+            "account_invoice_reference_compact_trgm_index "
+            "ON account_invoice USING gin (reference_compact gin_trgm_ops)"
+        )
+
     def _search(self, args, offset=0, limit=None, order=None, count=False,
                 access_rights_uid=None):
         domain = []
@@ -26,28 +79,30 @@ class AccountInvoice(models.Model):
                                 'not like', 'not ilike'):
                 domain.append(arg)
                 continue
-            if value:
-                value = value.replace(' ', '')
-                if not value:
-                    # original value contains only spaces, the query
-                    # would return all rows, so avoid a costly search
-                    # and drop the domain triplet
-                    continue
-                # add wildcards for the like search, except if the operator
-                # is =like of =ilike because they are supposed to be there yet
-                if operator.startswith('='):
-                    operator = operator[1:]
+            if not value:
+                # no reference is like nothing, and all the references are
+                # not like nothing
+                if operator in expression.NEGATIVE_TERM_OPERATORS:
+                    domain.append(expression.TRUE_LEAF)
                 else:
-                    value = '%%%s%%' % (value,)
-            # add filtered operator to query
-            query_op = ("SELECT id FROM account_invoice "
-                        "WHERE REPLACE(reference, ' ', '') %s %%s" %
-                        (operator,))
-            # avoid pylint check on no-sql-injection query_op is safe
-            query = query_op
-            self.env.cr.execute(query, (value,))
-            ids = [t[0] for t in self.env.cr.fetchall()]
-            domain.append(('id', 'in', ids))
+                    domain.append(expression.FALSE_LEAF)
+                continue
+            value = value.replace(' ', '')
+            if not value:
+                # original value contains only spaces, the search
+                # would return all rows, so avoid a costly search
+                # and replace the domain triplet
+                domain.append(expression.TRUE_LEAF)
+                continue
+            # the column is compared directly in the main query, wildcards
+            # are added by the ORM except for =like and =ilike
+            leaf = ('reference_compact', operator, value)
+            if operator in expression.NEGATIVE_TERM_OPERATORS:
+                # invoices without reference are not found by a negative
+                # search on the reference
+                domain += ['&', leaf, ('reference_compact', '!=', False)]
+            else:
+                domain.append(leaf)
 
         return super()._search(
             domain, offset=offset, limit=limit, order=order, count=count,
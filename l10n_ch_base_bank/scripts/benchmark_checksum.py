@@ -0,0 +1,47 @@
+# Copyright 2019 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+"""Micro-benchmarks of the checksums against odoo's mod10r
+
+Run it with a Python where odoo is importable, e.g.::
+
+    python l10n_ch_base_bank/scripts/benchmark_checksum.py 100000
+
+The argument is the number of random references, 2000 by default.
+"""
+import os
+import random
+import sys
+import timeit
+
+from odoo.tools.misc import mod10r as odoo_mod10r
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'tools'))
+import checksum  # noqa: E402
+
+
+def main(count=2000):
+    rand = random.Random(42)
+    numbers = [
+        ''.join(rand.choice('0123456789') for __ in range(size))
+        for size in (rand.randint(0, 30) for __ in range(count))
+    ]
+    references = [checksum.compute_isr_reference(n) for n in numbers]
+    timings = [
+        ('odoo mod10r', lambda: [odoo_mod10r(r[:-1]) for r in references]),
+        ('mod10r', lambda: [checksum.mod10r(r[:-1]) for r in references]),
+        ('validate_many', lambda: checksum.validate_many(references)),
+    ]
+    if checksum.numpy is not None:
+        array = checksum.numpy.array(references)
+        timings.append(
+            ('validate_many numpy', lambda: checksum.validate_many(array))
+        )
+    for name, func in timings:
+        duration = min(timeit.repeat(func, number=5, repeat=3))
+        print('%s: %.2f µs per reference'
+              % (name, duration / 5 / len(references) * 1e6))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]))
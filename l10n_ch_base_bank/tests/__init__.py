@@ -2,3 +2,5 @@ from . import test_bank
 from . import test_bank_type
 from . import test_create_invoice
 from . import test_search_invoice
+from . import test_checksum
+from . import test_postal
@@ -1,6 +1,8 @@
 # Copyright 2014-2015 Nicolas Bessi (Azure Interior SA)
 # Copyright 2015-2019 Yannick Vaucher (Camptocamp SA)
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+from unittest import mock
+
 from odoo.tests import common
 from odoo.tools import mute_logger
 from odoo import exceptions
@@ -304,6 +306,67 @@ class TestBank(common.SavepointCase):
         result = self.env['res.bank'].name_search('Lausanne-Centre')
         self.assertEqual(result and result[0][0], self.bank.id)
 
+    def test_name_search_ranking(self):
+        bank_obj = self.env['res.bank']
+        other_bank = bank_obj.create({
+            'name': 'Alternative Bank Zürich',
+            'city': 'Zürich',
+        })
+        self.bank.city = 'Olten'
+        result = bank_obj.name_search('alternative olten')
+        self.assertEqual([item[0] for item in result[:2]],
+                         [self.bank.id, other_bank.id])
+        result = bank_obj.name_search('Zürich Alternative')
+        self.assertEqual([item[0] for item in result[:2]],
+                         [other_bank.id, self.bank.id])
+        result = bank_obj.name_search(
+            'alternative', args=[('id', '!=', other_bank.id)])
+        self.assertNotIn(other_bank.id, [item[0] for item in result])
+        # wildcards are searched as such
+        self.assertFalse(bank_obj.name_search('Alternative_Bank'))
+        self.assertFalse(bank_obj.name_search('alternative', limit=1)[1:])
+
+    def test_resolve_many(self):
+        bank_obj = self.env['res.bank']
+        ibans = [CH_IBAN, CH_POSTFINANCE_IBAN, 'DE89370400440532013000', '']
+        result = bank_obj.resolve_many(ibans)
+        self.assertEqual(result[CH_IBAN], self.bank)
+        self.assertEqual(result[CH_POSTFINANCE_IBAN], self.post_bank)
+        self.assertFalse(result['DE89370400440532013000'])
+        self.assertFalse(result[''])
+        self.assertEqual(bank_obj._get_by_bic('alswch21xxx'), self.bank)
+
+    def test_resolve_many_cache_invalidation(self):
+        bank_obj = self.env['res.bank']
+        iban = 'CH93 0076 2011 6238 5295 7'
+        self.assertFalse(bank_obj.resolve_many([iban])[iban])
+        new_bank = bank_obj.create({
+            'name': 'Banque Cantonale Vaudoise',
+            'clearing': '00762',
+        })
+        self.assertEqual(bank_obj.resolve_many([iban])[iban], new_bank)
+        new_bank.clearing = '00767'
+        self.assertFalse(bank_obj.resolve_many([iban])[iban])
+        new_bank.clearing = '00762'
+        self.assertEqual(bank_obj.resolve_many([iban])[iban], new_bank)
+        new_bank.unlink()
+        self.assertFalse(bank_obj.resolve_many([iban])[iban])
+
+    def test_bank_index_cleared_once(self):
+        bank_obj = self.env['res.bank']
+        index = type(bank_obj)._get_bank_index
+        with mock.patch.object(index, 'clear_cache') as clear_cache:
+            banks = bank_obj.create([
+                {'name': 'Bank %d' % number, 'clearing': '9990%d' % number}
+                for number in range(3)
+            ])
+            self.assertEqual(clear_cache.call_count, 1)
+            # not part of the index
+            banks.write({'street': 'Rue du Lac 1'})
+            self.assertEqual(clear_cache.call_count, 1)
+            banks.write({'bic': 'TESTCHZZXXX'})
+            self.assertEqual(clear_cache.call_count, 2)
+
     def test_multiple_postal_number_for_same_partner(self):
         bank_acc = self.new_form()
         bank_acc.acc_number = CH_SUBSCRIPTION
@@ -344,6 +407,81 @@ class TestBank(common.SavepointCase):
             'Azure Interior/Postal number {} #2'.format(CH_SUBSCRIPTION)
         )
 
+    def test_multiple_postal_number_batch(self):
+        bank_obj = self.env['res.partner.bank']
+        base_name = 'Azure Interior/Postal number {}'.format(CH_SUBSCRIPTION)
+        other_partner = self.env.ref('base.res_partner_2')
+        # a free suffix is reused, and an unrelated suffix is ignored
+        bank_obj.create([
+            {'partner_id': self.partner.id, 'acc_number': base_name},
+            {'partner_id': self.partner.id,
+             'acc_number': base_name + ' #2'},
+            {'partner_id': self.partner.id,
+             'acc_number': base_name + ' #copy'},
+        ])
+        values = [{'partner_id': self.partner.id,
+                   'l10n_ch_postal': CH_SUBSCRIPTION}
+                  for __ in range(3)]
+        values.append({'partner_id': other_partner.id,
+                       'l10n_ch_postal': CH_POSTAL})
+        accounts = bank_obj.create(values)
+        self.assertEqual(accounts.mapped('acc_number'), [
+            base_name + ' #1',
+            base_name + ' #3',
+            base_name + ' #4',
+            '{}/Postal number {}'.format(other_partner.name, CH_POSTAL),
+        ])
+        self.assertEqual(
+            bank_obj._compute_names_from_postal_numbers([
+                (self.partner.name, CH_SUBSCRIPTION),
+                (False, False),
+            ]),
+            [base_name + ' #5', ''],
+        )
+
+    def test_import_rows(self):
+        bank_obj = self.env['res.partner.bank']
+        partner_id = self.partner.id
+        accounts, errors = bank_obj.import_rows([
+            {'partner_id': partner_id, 'acc_number': CH_IBAN},
+            {'partner_id': partner_id, 'acc_number': CH_POSTFINANCE_IBAN},
+            {'partner_id': partner_id, 'acc_number': CH_SUBSCRIPTION_9DIGITS},
+            {'partner_id': partner_id, 'acc_number': CH_POSTAL,
+             'bank_id': self.post_bank.id},
+            {'partner_id': partner_id, 'acc_number': 'R 12312123'},
+            # errors
+            {'acc_number': FR_IBAN},
+            {'partner_id': partner_id},
+            {'partner_id': partner_id, 'acc_number': CH_IBAN[:-1] + '8'},
+            {'partner_id': partner_id, 'l10n_ch_postal': '10-8060-8'},
+            {'partner_id': partner_id, 'l10n_ch_postal': '10-8060'},
+            {'partner_id': partner_id, 'acc_number': CH_IBAN.lower()},
+        ])
+        self.assertEqual(sorted(errors), [5, 6, 7, 8, 9, 10])
+        self.assertEqual(len(accounts), 5)
+        iban, post_iban, postal, post_postal, other = accounts
+        self.assertEqual(iban.bank_id, self.bank)
+        self.assertEqual(iban.acc_type, 'iban')
+        self.assertFalse(iban.l10n_ch_postal)
+        self.assertEqual(post_iban.bank_id, self.post_bank)
+        self.assertEqual(post_iban.l10n_ch_postal, CH_POSTAL)
+        self.assertFalse(postal.bank_id)
+        self.assertEqual(postal.l10n_ch_postal, CH_SUBSCRIPTION)
+        self.assertEqual(
+            postal.acc_number,
+            'Azure Interior/Postal number {}'.format(CH_SUBSCRIPTION)
+        )
+        self.assertEqual(post_postal.acc_number, CH_POSTAL)
+        self.assertEqual(post_postal.acc_type, 'postal')
+        self.assertEqual(other.acc_type, 'bank')
+        # existing accounts are refused
+        accounts, errors = bank_obj.import_rows([
+            {'partner_id': partner_id, 'acc_number': 'R 12312123'},
+            {'partner_id': partner_id, 'acc_number': 'R 12312124'},
+        ])
+        self.assertEqual(list(errors), [0])
+        self.assertEqual(accounts.acc_number, 'R 12312124')
+
     def test_acc_name_generation(self):
         # this test runs directly with object and onchange methods as Form
         # class has constrains to flash required field as partner_id is
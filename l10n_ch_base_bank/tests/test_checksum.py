@@ -0,0 +1,76 @@
+# Copyright 2019 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+import random
+import unittest
+
+from odoo.tests import common
+from odoo.tools.misc import mod10r as odoo_mod10r
+
+from ..tools import checksum
+
+ISR_REFERENCE = '210000000003139471430009017'
+ISRB_ID_NUMBER = '210000'
+
+
+class TestChecksum(common.BaseCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        rand = random.Random(42)
+        cls.numbers = [
+            ''.join(rand.choice('0123456789') for __ in range(size))
+            for size in (rand.randint(0, 30) for __ in range(2000))
+        ]
+
+    def test_same_as_odoo(self):
+        for number in self.numbers + ['01-162-', ' 12 345', 'abc']:
+            self.assertEqual(checksum.mod10r(number), odoo_mod10r(number))
+
+    def test_validate(self):
+        self.assertTrue(checksum.is_valid_mod10r(ISR_REFERENCE))
+        self.assertFalse(checksum.is_valid_mod10r(ISR_REFERENCE[:-1] + '8'))
+        self.assertFalse(checksum.is_valid_mod10r(''))
+        self.assertFalse(checksum.is_valid_mod10r(False))
+
+    def test_batch(self):
+        computed = checksum.compute_many(self.numbers)
+        self.assertEqual(computed, [odoo_mod10r(n) for n in self.numbers])
+        self.assertTrue(all(checksum.validate_many(computed)))
+        invalid = [n[:-1] + str((int(n[-1]) + 1) % 10) for n in computed]
+        self.assertFalse(any(checksum.validate_many(invalid)))
+
+    @unittest.skipIf(checksum.numpy is None, 'numpy is not installed')
+    def test_batch_numpy(self):
+        numpy = checksum.numpy
+        numbers = numpy.array(self.numbers)
+        computed = checksum.compute_many(numbers)
+        self.assertEqual(list(computed),
+                         [odoo_mod10r(n) for n in self.numbers])
+        self.assertTrue(checksum.validate_many(computed).all())
+        self.assertFalse(
+            checksum.validate_many(numpy.array(['', '12', ISR_REFERENCE[:-1]]))
+            .any())
+
+    def test_references(self):
+        spaced = '21 00000 00003 13947 14300 09017'
+        self.assertTrue(checksum.is_isr_reference(ISR_REFERENCE))
+        self.assertTrue(checksum.is_isr_reference(spaced))
+        self.assertFalse(checksum.is_isr_reference(ISR_REFERENCE[:-1]))
+        self.assertTrue(checksum.is_isrb_reference(spaced, ISRB_ID_NUMBER))
+        self.assertFalse(checksum.is_isrb_reference(spaced, '123456'))
+        # ID numbers are not all of the same length
+        self.assertTrue(checksum.is_isrb_reference(spaced, '2100000'))
+        self.assertTrue(checksum.is_isrb_reference(spaced, '21'))
+        self.assertFalse(checksum.is_isrb_reference(spaced, ''))
+        self.assertFalse(
+            checksum.is_isrb_reference(ISR_REFERENCE[:-1] + '8', '21'))
+        self.assertTrue(checksum.is_qr_reference(ISR_REFERENCE))
+        self.assertFalse(checksum.is_qr_reference('0' * 27))
+        self.assertEqual(
+            checksum.compute_isr_reference('3139471430009', ISRB_ID_NUMBER),
+            '210000000000031394714300090')
+        # only the last digits of a too long number are kept
+        self.assertEqual(
+            checksum.compute_isr_reference('99999' + '1' * 20, ISRB_ID_NUMBER),
+            '210000111111111111111111114')
@@ -0,0 +1,41 @@
+# Copyright 2019 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+from odoo import exceptions
+from odoo.tests import common
+
+from ..models.bank import pretty_l10n_ch_postal, validate_l10n_ch_postal
+from ..tools import postal
+
+
+class TestPostal(common.BaseCase):
+
+    def test_parse(self):
+        self.assertEqual(postal.parse('010001628'),
+                         postal.PostalNumber('010001628', '01-162-8',
+                                             True, None))
+        self.assertEqual(postal.parse('01-162-8'),
+                         postal.PostalNumber('010001628', '01-162-8',
+                                             True, None))
+        # formatted numbers are kept as given
+        self.assertEqual(postal.parse('01-000162-8').pretty, '01-000162-8')
+        self.assertEqual(postal.parse('01-162-9').error, postal.BAD_CHECKSUM)
+        self.assertEqual(postal.parse('01-162').error, postal.BAD_FORMAT)
+        self.assertEqual(postal.parse('0100016289').error, postal.BAD_FORMAT)
+        self.assertEqual(postal.parse('').error, postal.MISSING)
+        self.assertEqual(postal.parse(None).error, postal.MISSING)
+
+    def test_parse_cache(self):
+        postal.parse.cache_clear()
+        for __ in range(3):
+            postal.parse('10-8060-7')
+        info = postal.parse.cache_info()
+        self.assertEqual((info.misses, info.hits), (1, 2))
+
+    def test_validate(self):
+        validate_l10n_ch_postal('10-8060-7')
+        validate_l10n_ch_postal('100080607')
+        for number in ('', '10-8060-8', '10-8060', 'ABCDEFGHI'):
+            with self.assertRaises(exceptions.ValidationError):
+                validate_l10n_ch_postal(number)
+        self.assertEqual(pretty_l10n_ch_postal('100080607'), '10-8060-7')
+        self.assertEqual(pretty_l10n_ch_postal('10-8060-7'), '10-8060-7')
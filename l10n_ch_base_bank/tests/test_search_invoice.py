@@ -138,3 +138,48 @@ class TestSearchInvoice(common.SavepointCase):
             [('reference', 'like', '2999000000')],
         )
         self.assertEqual(invoice, found)
+
+    def test_search_compact_reference(self):
+        inv_form = self.new_form()
+        inv_form.reference = '27 29990 00000 00001 70400 25019'
+        invoice = inv_form.save()
+        self.assertEqual(invoice.reference_compact,
+                         '272999000000000017040025019')
+        invoice.reference = False
+        self.assertFalse(invoice.reference_compact)
+
+    def test_search_negative_operator(self):
+        inv_form = self.new_form()
+        inv_form.reference = '27 29990 00000 00001 70400 25019'
+        invoice = inv_form.save()
+        other_form = self.new_form()
+        other_form.reference = '11 11111 11111 11111 11111 11111'
+        other = other_form.save()
+        without_ref = self.new_form().save()
+
+        found = self.env['account.invoice'].search(
+            [('reference', 'not like', '17 040025'),
+             ('partner_id', '=', self.partner.id)],
+        )
+        self.assertEqual(found, other)
+        self.assertNotIn(invoice, found)
+        self.assertNotIn(without_ref, found)
+
+    def test_search_empty_value(self):
+        inv_form = self.new_form()
+        inv_form.reference = '27 29990 00000 00001 70400 25019'
+        invoice = inv_form.save()
+        without_ref = self.new_form().save()
+        invoices = invoice | without_ref
+        invoice_obj = self.env['account.invoice']
+        for value in (False, ''):
+            for operator in ('like', 'ilike', '=like', '=ilike'):
+                found = invoice_obj.search(
+                    [('reference', operator, value),
+                     ('id', 'in', invoices.ids)])
+                self.assertFalse(found)
+            for operator in ('not like', 'not ilike'):
+                found = invoice_obj.search(
+                    [('reference', operator, value),
+                     ('id', 'in', invoices.ids)])
+                self.assertEqual(found, invoices)
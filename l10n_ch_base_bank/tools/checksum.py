@@ -0,0 +1,247 @@
+# Copyright 2019 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+"""Recursive modulo 10 checksum used by swiss postal numbers and references
+
+Same results as :py:func:`odoo.tools.misc.mod10r`, using precomputed
+transition tables instead of arithmetic on every digit: the carry after
+a group of digits is looked up at once, so a 27 digits reference takes
+9 lookups.
+
+Numbers can be checked one by one or in batch with
+:py:func:`compute_many` and :py:func:`validate_many`, which also accept
+NumPy arrays of strings when NumPy is installed.
+"""
+import logging
+import re
+
+_logger = logging.getLogger(__name__)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+    _logger.debug('Cannot import numpy, batch checksums use pure python')
+
+MOD10R_CODEC = (0, 9, 4, 6, 8, 2, 7, 1, 3, 5)
+
+# number of digits looked up at once
+GROUP_SIZE = 3
+
+ISR_REFERENCE_SIZE = 27
+
+_non_digits = re.compile(r'[^0-9]')
+_isr_reference = re.compile(r'[0-9]{%d}$' % ISR_REFERENCE_SIZE)
+
+
+def _build_transitions():
+    """Return the carry after a group of digits, by group and carry before
+
+    Groups of 1 to `GROUP_SIZE` digits are computed, the shorter ones
+    being used for the last digits of a number.
+    """
+    transitions = {
+        str(digit): tuple(MOD10R_CODEC[(carry + digit) % 10]
+                          for carry in range(10))
+        for digit in range(10)
+    }
+    groups = list(transitions)
+    for __ in range(GROUP_SIZE - 1):
+        longer_groups = []
+        for group in groups:
+            for digit in range(10):
+                longer_group = group + str(digit)
+                last = transitions[str(digit)]
+                transitions[longer_group] = tuple(
+                    last[carry] for carry in transitions[group]
+                )
+                longer_groups.append(longer_group)
+        groups = longer_groups
+    return transitions
+
+
+# group of digits: carry after reading it, indexed by the carry before it.
+_TRANSITIONS = _build_transitions()
+
+
+def _carry(digits):
+    carry = 0
+    transitions = _TRANSITIONS
+    for start in range(0, len(digits), GROUP_SIZE):
+        carry = transitions[digits[start:start + GROUP_SIZE]][carry]
+    return carry
+
+
+def mod10r_check_digit(number):
+    """Return the recursive modulo 10 check digit of a number
+
+    :param number: digits, other characters are ignored
+    :type number: str
+
+    :rtype: str
+    """
+    digits = _non_digits.sub('', number)
+    return str((10 - _carry(digits)) % 10)
+
+
+def mod10r(number):
+    """Append the recursive modulo 10 check digit to a number
+
+    :param number: digits, other characters are ignored
+    :type number: str
+
+    :rtype: str
+    """
+    return number + mod10r_check_digit(number)
+
+
+def is_valid_mod10r(number):
+    """Check that the last digit of a number is its recursive modulo 10
+    check digit
+
+    :param number: digits, other characters are ignored
+    :type number: str
+
+    :rtype: bool
+    """
+    digits = _non_digits.sub('', number or '')
+    if not digits:
+        return False
+    return str((10 - _carry(digits[:-1])) % 10) == digits[-1]
+
+
+def _numpy_carries(numbers):
+    """Return the carries and the number of digits of an array of strings
+
+    Characters other than digits, including the padding of the shorter
+    strings, keep the carry unchanged.
+
+    :rtype: tuple of 2 NumPy arrays of ints
+    """
+    numbers = numpy.asarray(numbers)
+    if numbers.dtype.kind == 'U':
+        numbers = numpy.char.encode(numbers, 'ascii', 'replace')
+    width = max(numbers.dtype.itemsize, 1)
+    codes = numpy.frombuffer(
+        numpy.ascontiguousarray(numbers).tobytes(), dtype=numpy.uint8
+    ).reshape(len(numbers), width).astype(numpy.int16) - ord('0')
+    is_digit = (codes >= 0) & (codes <= 9)
+    codes[~is_digit] = 0
+    table = numpy.array(
+        [_TRANSITIONS[str(digit)] for digit in range(10)], dtype=numpy.int8
+    )
+    carries = numpy.zeros(len(numbers), dtype=numpy.int8)
+    for column in range(width):
+        digits = codes[:, column]
+        carries = numpy.where(is_digit[:, column],
+                              table[digits, carries], carries)
+    return carries, is_digit.sum(axis=1)
+
+
+def _is_numpy_array(numbers):
+    return numpy is not None and isinstance(numbers, numpy.ndarray)
+
+
+def compute_many(numbers):
+    """Append the recursive modulo 10 check digit to many numbers
+
+    :param numbers: numbers, as strings; characters other than digits
+                    are ignored
+    :type numbers: iterable of str or NumPy array of strings
+
+    :return: numbers with their check digit, an array of str for an
+             array of strings
+    :rtype: list of str or NumPy array
+    """
+    if _is_numpy_array(numbers):
+        if not len(numbers):
+            return numbers.astype(str)
+        carries, __ = _numpy_carries(numbers)
+        check_digits = ((10 - carries) % 10).astype(str)
+        return numpy.char.add(numbers.astype(str), check_digits)
+    return [mod10r(number) for number in numbers]
+
+
+def validate_many(numbers):
+    """Check the recursive modulo 10 check digit of many numbers
+
+    :param numbers: numbers with their check digit, as strings;
+                    characters other than digits are ignored
+    :type numbers: iterable of str or NumPy array of strings
+
+    :return: validity of each number, an array of bool for an array of
+             strings
+    :rtype: list of bool or NumPy array
+    """
+    if _is_numpy_array(numbers):
+        if not len(numbers):
+            return numpy.zeros(0, dtype=bool)
+        # the carry of a number followed by its check digit is always 0
+        carries, digit_counts = _numpy_carries(numbers)
+        return (carries == 0) & (digit_counts > 0)
+    return [is_valid_mod10r(number) for number in numbers]
+
+
+def is_isr_reference(reference):
+    """Check an ISR reference: 27 digits ending with its check digit
+
+    :param reference: reference, spaces are ignored
+    :type reference: str
+
+    :rtype: bool
+    """
+    reference = (reference or '').replace(' ', '')
+    return bool(_isr_reference.match(reference)) and is_valid_mod10r(reference)
+
+
+def is_isrb_reference(reference, id_number):
+    """Check an ISR-B reference: an ISR reference starting with the ISR-B
+    customer ID number given by the bank, whatever its length
+
+    :param reference: reference, spaces are ignored
+    :type reference: str
+
+    :param id_number: ISR-B customer ID number
+    :type id_number: str
+
+    :rtype: bool
+    """
+    if not id_number:
+        return False
+    reference = (reference or '').replace(' ', '')
+    return reference.startswith(id_number) and is_isr_reference(reference)
+
+
+def is_qr_reference(reference):
+    """Check a QR reference (QRR) of a QR-bill
+
+    A QR reference has the same format as an ISR reference, but cannot
+    be made of zeros only.
+
+    :param reference: reference, spaces are ignored
+    :type reference: str
+
+    :rtype: bool
+    """
+    reference = (reference or '').replace(' ', '')
+    return is_isr_reference(reference) and bool(reference.strip('0'))
+
+
+def compute_isr_reference(number, id_number=''):
+    """Return the ISR reference of a number, with its check digit
+
+    The number is prefixed by the ISR-B customer ID number, if any, and
+    padded with zeros to the size of a reference. The last digits are
+    kept when it is too long.
+
+    :param number: digits identifying the document
+    :type number: str
+
+    :param id_number: ISR-B customer ID number
+    :type id_number: str
+
+    :rtype: str
+    """
+    id_number = id_number or ''
+    size = ISR_REFERENCE_SIZE - 1 - len(id_number)
+    number = _non_digits.sub('', number)[-size:] if size else ''
+    return mod10r(id_number + number.rjust(size, '0'))
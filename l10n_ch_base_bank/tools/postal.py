@@ -0,0 +1,71 @@
+# Copyright 2019 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+"""Swiss postal account numbers
+
+A postal account number, or ISR subscription number, is written with
+separators, e.g. 01-162-8, or as 9 digits, e.g. 010001628, the last one
+being a recursive modulo 10 check digit.
+
+:py:func:`parse` reads a number once with precompiled patterns and gives
+its 9 digits form, its form with separators and its validity. Results are
+cached by raw value, as the same numbers are validated and formatted
+several times by the create, the write and the constraints.
+"""
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+from .checksum import is_valid_mod10r
+
+PARSE_CACHE_SIZE = 4096
+
+POSTAL_FORMAT = re.compile(r'([0-9]{2})-([0-9]{1,6})-([0-9])$')
+POSTAL_DIGITS = re.compile(r'[0-9]{9}$')
+LEADING_ZEROS = re.compile(r'^0*')
+
+# error codes
+MISSING = 'missing'
+BAD_FORMAT = 'format'
+BAD_CHECKSUM = 'checksum'
+
+PostalNumber = namedtuple('PostalNumber', (
+    'digits',  # 9 digits form, None when not in a postal number format
+    'pretty',  # form with separators, the number itself when formatted
+    'valid',   # format and check digit are correct
+    'error',   # error code, None when valid
+))
+
+
+def _pretty(number):
+    """Insert the separators in a number of 9 digits, e.g. 010001628 ->
+    01-162-8"""
+    return '%s-%s-%s' % (number[:2],
+                         LEADING_ZEROS.sub('', number[2:-1]),
+                         number[-1])
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse(number):
+    """Parse a postal account number, formatted or not
+
+    :param number: postal account number
+    :type number: str
+
+    :rtype: :py:class:`PostalNumber`
+    """
+    if not number:
+        return PostalNumber(None, number, False, MISSING)
+    match = POSTAL_FORMAT.match(number)
+    if match:
+        digits = (match.group(1) + match.group(2).rjust(6, '0') +
+                  match.group(3))
+        pretty = number
+    elif POSTAL_DIGITS.match(number):
+        digits = number
+        pretty = _pretty(number)
+    else:
+        # formatted anyway, as numbers were before being validated
+        return PostalNumber(None, _pretty(number), False, BAD_FORMAT)
+    if not is_valid_mod10r(digits):
+        return PostalNumber(digits, pretty, False, BAD_CHECKSUM)
+    return PostalNumber(digits, pretty, True, None)
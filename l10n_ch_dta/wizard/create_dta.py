@@ -8,7 +8,8 @@ import time
 from datetime import datetime
 
 from odoo import models, fields, api, _, exceptions
-from odoo.tools import DEFAULT_SERVER_DATETIME_FORMAT, mod10r
+from odoo.tools import DEFAULT_SERVER_DATETIME_FORMAT
+from odoo.addons.l10n_ch_base_bank.tools.checksum import mod10r
 
 from . import unicode2ascii
 
@@ -15,7 +15,9 @@
         'base_transaction_id',
     ],
     'data': [
+        "security/ir.model.access.csv",
         "wizard/isr_import_view.xml",
+        "wizard/isr_bulk_import_view.xml",
     ],
     'images': [],
     'demo': [],
@@ -0,0 +1,118 @@
+# Copyright 2019 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+import hashlib
+
+from odoo import api, fields, models
+from odoo.tools import split_every
+
+
+class V11ImportHash(models.Model):
+    """Hashes of the imported V11 files and records
+
+    Used to refuse a file imported twice, and to skip the records already
+    imported from another file. The hash of a record includes its
+    occurrence in its file, so identical records of a same file are all
+    imported once. Hashes are unique by company, so the same file can be
+    imported in the statements of several companies.
+    """
+
+    _name = 'v11.import.hash'
+    _description = 'Hash of an imported V11 file or record'
+
+    name = fields.Char('Hash', required=True, index=True, readonly=True)
+    hash_type = fields.Selection(
+        [('file', 'File'),
+         ('record', 'Record')],
+        required=True,
+        readonly=True,
+    )
+    statement_id = fields.Many2one(
+        comodel_name='account.bank.statement',
+        string='Statement',
+        ondelete='cascade',
+        readonly=True,
+    )
+    company_id = fields.Many2one(
+        comodel_name='res.company',
+        string='Company',
+        required=True,
+        index=True,
+        readonly=True,
+    )
+
+    _sql_constraints = [('unique_name',
+                         'UNIQUE (name, company_id)',
+                         'A V11 file or record is imported only once')]
+
+    @api.model
+    def _file_hash(self, stream):
+        """Return the hash of the content of a file
+
+        :param stream: content of the file
+        :type stream: binary file object
+
+        :rtype: str
+        """
+        file_hash = hashlib.sha256()
+        for chunk in iter(lambda: stream.read(64 * 1024), b''):
+            file_hash.update(chunk)
+        return file_hash.hexdigest()
+
+    @api.model
+    def _record_hash(self, record, occurrence):
+        """Return the hash of a record
+
+        :param record: dict representing a v11 entry
+        :type record: dict
+
+        :param occurrence: number of identical records before this one in
+                           the file
+        :type occurrence: int
+
+        :rtype: str
+        """
+        key = '%s|%.2f|%s|%.2f|%d' % (record['reference'], record['amount'],
+                                      record['date'], record['cost'],
+                                      occurrence)
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    @api.model
+    def _find_existing(self, hashes, company):
+        """Return the hashes already imported in a company
+
+        :param hashes: hashes to check
+        :type hashes: iterable of str
+
+        :param company: company of the import
+        :type company: :py:class:`openerp.models.Models` record
+
+        :rtype: set
+        """
+        existing = set()
+        for chunk in split_every(1000, hashes):
+            existing.update(
+                self.search([('name', 'in', list(chunk)),
+                             ('company_id', '=', company.id)]).mapped('name')
+            )
+        return existing
+
+    @api.model
+    def _register(self, hashes, hash_type, statement):
+        """Store the hashes of imported files or records
+
+        :param hashes: hashes to store
+        :type hashes: iterable of str
+
+        :param hash_type: 'file' or 'record'
+        :type hash_type: str
+
+        :param statement: statement of the imported lines, its company is
+                          the one of the hashes
+        :type statement: :py:class:`openerp.models.Models` record
+        """
+        return self.create([{
+            'name': hash_value,
+            'hash_type': hash_type,
+            'statement_id': statement.id,
+            'company_id': statement.company_id.id,
+        } for hash_value in hashes])
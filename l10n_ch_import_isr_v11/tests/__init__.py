@@ -1,4 +1,6 @@
 # Copyright 2018 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
-from . import test_v11_files
+from . import test_v11_decoder
+from . import test_v11_import
+from . import test_v11_bulk_import
@@ -0,0 +1,93 @@
+# Copyright 2019 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+import base64
+import io
+import zipfile
+from unittest import mock
+
+from odoo import exceptions
+from odoo.modules import get_module_resource
+from odoo.tests.common import TransactionCase
+
+
+class TestV11BulkImport(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.journal = self.env['account.journal'].create({
+            'name': 'Bank Journal - (test)',
+            'code': 'TBK',
+            'type': 'bank',
+        })
+        v11_path = get_module_resource(
+            'l10n_ch_import_isr_v11', 'tests', 'test_v11_files', 'test1.v11'
+        )
+        with open(v11_path, mode='rb') as v11_file:
+            self.v11_content = v11_file.read()
+
+    def make_attachment(self, name, content):
+        return self.env['ir.attachment'].create({
+            'name': name,
+            'datas_fname': name,
+            'datas': base64.b64encode(content),
+        })
+
+    def test_bulk_import(self):
+        # same record processed another day
+        other_content = self.v11_content[:65] + b'221018' + \
+            self.v11_content[71:]
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zip_file:
+            zip_file.writestr('test2.v11', other_content)
+        attachments = (
+            self.make_attachment('test1.v11', self.v11_content) |
+            self.make_attachment('files.zip', archive.getvalue()) |
+            self.make_attachment('invalid.v11', b'not a v11 file') |
+            self.make_attachment('again.v11', self.v11_content)
+        )
+        wizard = self.env['v11.bulk.import.wizard'].with_context(
+            active_model='account.journal',
+            active_id=self.journal.id,
+        ).create({
+            'attachment_ids': [(6, 0, attachments.ids)],
+        })
+        self.assertEqual(wizard.journal_id, self.journal)
+        wizard.import_files()
+        self.assertEqual(wizard.state, 'done')
+        statements = self.env['account.bank.statement'].search(
+            [('journal_id', '=', self.journal.id)])
+        self.assertEqual(
+            sorted(statements.mapped('name')),
+            ['files.zip/test2.v11', 'test1.v11'])
+        for statement in statements:
+            self.assertEqual(len(statement.line_ids), 1)
+            self.assertEqual(statement.line_ids.amount, 5415.0)
+        # files are imported in the order of their upload
+        summary = wizard.summary.splitlines()
+        self.assertEqual(len(summary), 4)
+        self.assertTrue(summary[0].startswith('test1.v11: 1 lines imported'))
+        self.assertTrue(
+            summary[1].startswith('files.zip/test2.v11: 1 lines imported'))
+        self.assertTrue(summary[2].startswith('invalid.v11: not imported'))
+        self.assertTrue(summary[3].startswith('again.v11: not imported'))
+
+    def test_bulk_import_archive_limits(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zip_file:
+            zip_file.writestr('test1.v11', self.v11_content)
+            zip_file.writestr('test2.v11', self.v11_content)
+        wizard = self.env['v11.bulk.import.wizard'].create({
+            'journal_id': self.journal.id,
+            'attachment_ids': [
+                (4, self.make_attachment('files.zip', archive.getvalue()).id)
+            ],
+        })
+        wizard_class = type(wizard)
+        with mock.patch.object(wizard_class, '_max_archive_files', 1):
+            with self.assertRaises(exceptions.UserError):
+                list(wizard._iter_files())
+        with mock.patch.object(wizard_class, '_max_archive_size',
+                               len(self.v11_content) + 1):
+            with self.assertRaises(exceptions.UserError):
+                list(wizard._iter_files())
+        self.assertEqual(len(list(wizard._iter_files())), 2)
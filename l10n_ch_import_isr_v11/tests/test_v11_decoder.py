@@ -0,0 +1,93 @@
+# Copyright 2019 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+import random
+import time
+
+from odoo.tests import common
+
+from ..tools.v11_decoder import V11DecodeError, V11Record, decoder
+
+CREDIT_3 = (b'002010121627005095000000000000000000013000054150000'
+            b'01  000106101722101706101700000000010000000000000')
+TOTAL_3 = (b'99901012162799999999999999999999999999900000005415'
+           b'0000000000001061018000000000000000000')
+CREDIT_4 = (b'00201101012162700509500000000000000000001'
+            b'3CHF000000541500' + b' ' * 35 +
+            b'202210162022101720221018 CHF000120  ')
+TOTAL_4 = (b'999991010121627' + b'9' * 27 +
+           b'CHF000000541500000000000001' +
+           b'20221018CHF00000000120' + b' ' * 37)
+
+
+class TestV11Decoder(common.BaseCase):
+
+    def test_decode_type_3(self):
+        self.assertEqual(
+            decoder.decode(CREDIT_3),
+            V11Record(code='002',
+                      reference='005095000000000000000000013',
+                      amount=541500,
+                      cost=0,
+                      date='2022-10-17',
+                      count=None))
+        self.assertEqual(
+            decoder.decode(TOTAL_3),
+            V11Record(code='999',
+                      reference=None,
+                      amount=54150,
+                      cost=0,
+                      date='2006-10-18',
+                      count=1))
+
+    def test_decode_type_4(self):
+        self.assertEqual(
+            decoder.decode(CREDIT_4),
+            V11Record(code='002',
+                      reference='005095000000000000000000013',
+                      amount=541500,
+                      cost=120,
+                      date='2022-10-17',
+                      count=None))
+        self.assertEqual(
+            decoder.decode(TOTAL_4),
+            V11Record(code='999',
+                      reference=None,
+                      amount=541500,
+                      cost=120,
+                      date='2022-10-18',
+                      count=1))
+
+    def test_decode_reversal(self):
+        record = decoder.decode(b'005' + CREDIT_3[3:])
+        self.assertEqual(record.amount, -541500)
+        self.assertEqual(record.cost, 0)
+
+    def test_decode_invalid(self):
+        with self.assertRaises(V11DecodeError):
+            decoder.decode(CREDIT_3[:-1])
+        with self.assertRaises(V11DecodeError):
+            decoder.decode(CREDIT_3[:39] + b'ABCDEFGHIJ' + CREDIT_3[49:])
+        # invalid processing date
+        with self.assertRaises(V11DecodeError):
+            decoder.decode(CREDIT_3[:65] + b'221317' + CREDIT_3[71:])
+
+    def test_same_as_slicing(self):
+        """The decoder gives the values of the slicing of the lines"""
+        rand = random.Random(42)
+        for __ in range(200):
+            amount = b'%010d' % rand.randint(1, 10 ** 8)
+            cost = b'%04d' % rand.randint(0, 9999)
+            date = b'2210%02d' % rand.randint(1, 28)
+            line = (CREDIT_3[:39] + amount + CREDIT_3[49:65] + date +
+                    CREDIT_3[71:96] + cost)
+            sliced = line.decode('ascii')
+            record = decoder.decode(line)
+            self.assertEqual(record.reference, sliced[12:39])
+            self.assertEqual(record.amount / 100.0,
+                             float(sliced[39:49]) / 100.0)
+            self.assertEqual(record.cost / 100.0,
+                             float(sliced[96:100]) / 100.0)
+            self.assertEqual(
+                record.date,
+                time.strftime('%Y-%m-%d',
+                              time.strptime(sliced[65:71], '%y%m%d')))
@@ -1,15 +1,18 @@
 # Copyright 2018 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 import base64
+import io
 
+from odoo import exceptions
 from odoo.modules import get_module_resource
 from odoo.tests.common import TransactionCase
+from odoo.addons.l10n_ch_import_isr_v11.wizard.isr_import import Base64Reader
 
 
 class TestV11import(TransactionCase):
     def test_file_parsing(self):
         v11_path = get_module_resource(
-            'l10n_ch_payment_slip', 'tests', 'test_v11_files', 'test1.v11'
+            'l10n_ch_import_isr_v11', 'tests', 'test_v11_files', 'test1.v11'
         )
         with open(v11_path, mode="r+b") as v11_file:
             importer = self.env['v11.import.wizard'].create(
@@ -31,6 +34,32 @@ class TestV11import(TransactionCase):
                 }
             )
 
+    def test_stream_parsing(self):
+        v11_path = get_module_resource(
+            'l10n_ch_import_isr_v11', 'tests', 'test_v11_files', 'test1.v11'
+        )
+        with open(v11_path, mode="rb") as v11_file:
+            record, total = v11_file.read().splitlines()
+        importer = self.env['v11.import.wizard'].create({})
+        expected = [{
+            'date': '2022-10-17',
+            'amount': 5415.0,
+            'cost': 0.0,
+            'reference': '005095000000000000000000013'
+        }]
+        # line breaks are optional between records
+        for content in (record + b'\r\n' + total + b'\r\n',
+                        record + total):
+            stream = io.BufferedReader(
+                Base64Reader(base64.encodebytes(content), read_size=8)
+            )
+            records = importer._iter_records(importer._iter_lines(stream))
+            self.assertEqual(list(records), expected)
+        with self.assertRaises(exceptions.UserError):
+            importer._parse_lines(
+                [record.decode(), total.decode(), record.decode()]
+            )
+
     def test_statement_import(self):
         journal_usd = self.env['account.journal'].create(
             {
@@ -49,7 +78,7 @@ class TestV11import(TransactionCase):
             active_id=statement.id
         )
         v11_path = get_module_resource(
-            'l10n_ch_payment_slip', 'tests', 'test_v11_files', 'test1.v11'
+            'l10n_ch_import_isr_v11', 'tests', 'test_v11_files', 'test1.v11'
         )
         with open(v11_path, mode="r+b") as v11_file:
             importer = importer_model.create(
@@ -64,3 +93,160 @@ class TestV11import(TransactionCase):
         self.assertEqual(line.name, '005095000000000000000000013')
         self.assertEqual(line.ref, '/')
         self.assertEqual(line.amount, 5415.0)
+
+    def test_duplicate_import(self):
+        journal = self.env['account.journal'].create({
+            'name': 'Bank Journal - (test)',
+            'code': 'TBK',
+            'type': 'bank',
+        })
+        statement = self.env['account.bank.statement'].create({
+            'journal_id': journal.id,
+        })
+        importer_model = self.env['v11.import.wizard'].with_context(
+            active_id=statement.id
+        )
+        v11_path = get_module_resource(
+            'l10n_ch_import_isr_v11', 'tests', 'test_v11_files', 'test1.v11'
+        )
+        with open(v11_path, mode="rb") as v11_file:
+            content = v11_file.read()
+        importer_model.create({
+            'v11file': base64.encodebytes(content)
+        }).import_v11()
+        self.assertEqual(len(statement.line_ids), 1)
+        # same file
+        with self.assertRaises(exceptions.UserError):
+            importer_model.create({
+                'v11file': base64.encodebytes(content)
+            }).import_v11()
+        # same records in another file
+        importer_model.create({
+            'v11file': base64.encodebytes(content.replace(b'\n', b'\r\n'))
+        }).import_v11()
+        statement.refresh()
+        self.assertEqual(len(statement.line_ids), 1)
+        self.assertEqual(
+            self.env['v11.import.hash'].search_count(
+                [('statement_id', '=', statement.id)]),
+            3)
+
+    def test_duplicate_import_other_company(self):
+        journal = self.env['account.journal'].create({
+            'name': 'Bank Journal - (test)',
+            'code': 'TBK',
+            'type': 'bank',
+        })
+        statement = self.env['account.bank.statement'].create({
+            'journal_id': journal.id,
+        })
+        v11_path = get_module_resource(
+            'l10n_ch_import_isr_v11', 'tests', 'test_v11_files', 'test1.v11'
+        )
+        with open(v11_path, mode="rb") as v11_file:
+            content = v11_file.read()
+        self.env['v11.import.wizard'].with_context(
+            active_id=statement.id
+        ).create({
+            'v11file': base64.encodebytes(content)
+        }).import_v11()
+        hash_obj = self.env['v11.import.hash']
+        file_hash = hash_obj._file_hash(io.BytesIO(content))
+        company = statement.company_id
+        other_company = self.env['res.company'].create({
+            'name': 'Other company (test)',
+        })
+        self.assertEqual(hash_obj._find_existing([file_hash], company),
+                         {file_hash})
+        self.assertFalse(hash_obj._find_existing([file_hash], other_company))
+        # the same file can be imported in another company
+        hash_obj.create({
+            'name': file_hash,
+            'hash_type': 'file',
+            'company_id': other_company.id,
+        })
+        self.assertEqual(
+            hash_obj._find_existing([file_hash], other_company), {file_hash})
+
+    def test_camt054_parsing(self):
+        camt_path = get_module_resource(
+            'l10n_ch_import_isr_v11', 'tests', 'test_v11_files',
+            'test1_camt054.xml'
+        )
+        importer = self.env['v11.import.wizard'].create({})
+        with open(camt_path, mode="rb") as camt_file:
+            records = list(importer._iter_decoded_records(
+                importer._iter_camt054_lines(camt_file)
+            ))
+        self.assertEqual(
+            records, [{
+                'date': '2022-10-17',
+                'amount': 5415.0,
+                'cost': 0.0,
+                'reference': '005095000000000000000000013'
+            }]
+        )
+        with self.assertRaises(exceptions.UserError):
+            list(importer._iter_camt054_lines(io.BytesIO(b'<Document>')))
+        with self.assertRaises(exceptions.UserError):
+            list(importer._iter_camt054_lines(io.BytesIO(
+                b'<Document xmlns="urn:iso:std:iso:20022:tech:xsd:'
+                b'pain.001.001.03"></Document>'
+            )))
+        # the amount of an entry without transactions would be lost
+        with self.assertRaises(exceptions.UserError):
+            list(importer._iter_camt054_lines(io.BytesIO(
+                b'<Document xmlns="urn:iso:std:iso:20022:tech:xsd:'
+                b'camt.054.001.04"><BkToCstmrDbtCdtNtfctn><Ntfctn><Ntry>'
+                b'<Amt Ccy="CHF">5415.00</Amt><CdtDbtInd>CRDT</CdtDbtInd>'
+                b'<BookgDt><Dt>2022-10-18</Dt></BookgDt>'
+                b'</Ntry></Ntfctn></BkToCstmrDbtCdtNtfctn></Document>'
+            )))
+
+    def test_camt054_statement_import(self):
+        journal = self.env['account.journal'].create({
+            'name': 'Bank Journal - (test)',
+            'code': 'TBK',
+            'type': 'bank',
+        })
+        statement = self.env['account.bank.statement'].create({
+            'journal_id': journal.id,
+        })
+        camt_path = get_module_resource(
+            'l10n_ch_import_isr_v11', 'tests', 'test_v11_files',
+            'test1_camt054.xml'
+        )
+        with open(camt_path, mode="rb") as camt_file:
+            importer = self.env['v11.import.wizard'].with_context(
+                active_id=statement.id
+            ).create({
+                'v11file': base64.encodebytes(camt_file.read())
+            })
+        importer.import_v11()
+        statement.refresh()
+        self.assertEqual(len(statement.line_ids), 1)
+        self.assertEqual(statement.line_ids.name,
+                         '005095000000000000000000013')
+        self.assertEqual(statement.line_ids.amount, 5415.0)
+
+    def test_camt054_statement_import_other_xml(self):
+        journal = self.env['account.journal'].create({
+            'name': 'Bank Journal - (test)',
+            'code': 'TBK',
+            'type': 'bank',
+        })
+        statement = self.env['account.bank.statement'].create({
+            'journal_id': journal.id,
+        })
+        content = b'<?xml version="1.0"?>\n<invoices><invoice/></invoices>'
+        importer = self.env['v11.import.wizard'].with_context(
+            active_id=statement.id
+        ).create({
+            'v11file': base64.encodebytes(content)
+        })
+        with self.assertRaises(exceptions.UserError):
+            importer.import_v11()
+        self.assertFalse(statement.line_ids)
+        self.assertFalse(
+            self.env['v11.import.hash'].search(
+                [('statement_id', '=', statement.id)]))
@@ -0,0 +1,164 @@
+# Copyright 2019 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+"""Parsing of camt.054 ISR credit notifications
+
+The XML document is parsed incrementally and the parsed elements are
+cleared, so the memory used does not depend on the size of the file.
+The transactions are returned as :py:class:`V11Record`, like the records
+of a V11 file, to be imported the same way.
+"""
+from decimal import Decimal
+
+from lxml import etree
+
+from .v11_decoder import V11DecodeError, V11Record
+
+# camt.054 does not have transaction codes, use the ones of V11
+CREDIT_CODE = '002'
+REVERSAL_CODE = '005'
+
+XML_START = b'<'
+# namespace of all the versions of camt.054, e.g. camt.054.001.04
+CAMT054_NAMESPACE = 'urn:iso:std:iso:20022:tech:xsd:camt.054'
+ROOT_TAG = 'Document'
+UTF8_BOM = b'\xef\xbb\xbf'
+
+
+def is_camt054(head):
+    """Tell if the beginning of a file is an XML document
+
+    :param head: first bytes of the file
+    :type head: bytes
+
+    :rtype: bool
+    """
+    if head.startswith(UTF8_BOM):
+        head = head[len(UTF8_BOM):]
+    return head.lstrip().startswith(XML_START)
+
+
+def _check_root(element):
+    """Refuse an XML document which is not a camt.054 notification"""
+    qname = etree.QName(element)
+    if qname.localname != ROOT_TAG or \
+            not (qname.namespace or '').startswith(CAMT054_NAMESPACE):
+        raise V11DecodeError(
+            'Not a camt.054 notification, root element is %s' % qname.text)
+
+
+def _cents(text):
+    try:
+        return int((Decimal(text) * 100).to_integral_value())
+    except ArithmeticError:
+        raise V11DecodeError('Invalid amount %r' % text)
+
+
+def _clear(element):
+    """Free a parsed element and its previous siblings"""
+    element.clear()
+    parent = element.getparent()
+    if parent is not None:
+        while element.getprevious() is not None:
+            del parent[0]
+
+
+def iter_records(stream):
+    """Parse the transactions of a camt.054 notification one by one
+
+    The root element must be a camt.054 Document. Each entry must hold
+    transaction details, and its amount is checked against the sum of its
+    transactions.
+
+    :param stream: content of the camt.054 file
+    :type stream: binary file object
+
+    :rtype: generator of :py:class:`V11Record`
+    """
+    path = []
+    entry = transaction = None
+    parser = etree.iterparse(
+        stream,
+        events=('start', 'end'),
+        resolve_entities=False,
+        no_network=True,
+        huge_tree=True,
+        remove_comments=True,
+    )
+    for event, element in parser:
+        if not isinstance(element.tag, str):
+            continue
+        tag = etree.QName(element).localname
+        if event == 'start':
+            if not path:
+                _check_root(element)
+            path.append(tag)
+            if tag == 'Ntry':
+                entry = {'amount': None, 'sign': 1, 'date': None, 'total': 0,
+                         'count': 0}
+            elif tag == 'TxDtls' and entry is not None:
+                transaction = {'amount': None, 'sign': entry['sign'],
+                               'cost': 0, 'total_cost': False,
+                               'reference': '', 'date': None}
+            continue
+        text = (element.text or '').strip()
+        parent = path[-2] if len(path) > 1 else None
+        if transaction is not None:
+            if tag == 'TxDtls':
+                record = _make_record(transaction, entry)
+                entry['total'] += record.amount
+                entry['count'] += 1
+                transaction = None
+                _clear(element)
+                yield record
+            elif tag == 'Amt' and parent in ('TxDtls', 'TxAmt'):
+                transaction['amount'] = _cents(text)
+            elif tag == 'CdtDbtInd' and parent == 'TxDtls':
+                transaction['sign'] = -1 if text == 'DBIT' else 1
+            elif tag == 'Ref' and parent == 'CdtrRefInf':
+                transaction['reference'] = text
+            elif tag == 'TtlChrgsAndTaxAmt':
+                transaction['cost'] = _cents(text)
+                transaction['total_cost'] = True
+            elif tag == 'Amt' and parent == 'Rcrd' and \
+                    not transaction['total_cost']:
+                # charges without total
+                transaction['cost'] += _cents(text)
+            elif tag == 'AccptncDtTm':
+                transaction['date'] = text[:10]
+        elif entry is not None:
+            if tag == 'Ntry':
+                if not entry['count']:
+                    # its amount would not be imported
+                    raise V11DecodeError(
+                        'Entry without transaction details')
+                if entry['amount'] is not None and \
+                        entry['total'] != entry['sign'] * entry['amount']:
+                    raise V11DecodeError(
+                        'Amount of an entry differs from the sum of its '
+                        'transactions')
+                entry = None
+                _clear(element)
+            elif tag == 'Amt' and parent == 'Ntry':
+                entry['amount'] = _cents(text)
+            elif tag == 'CdtDbtInd' and parent == 'Ntry':
+                entry['sign'] = -1 if text == 'DBIT' else 1
+            elif tag in ('Dt', 'DtTm') and parent == 'BookgDt':
+                entry['date'] = text[:10]
+        path.pop()
+
+
+def _make_record(transaction, entry):
+    if transaction['amount'] is None:
+        raise V11DecodeError('Transaction without amount')
+    date = transaction['date'] or entry['date']
+    if not date:
+        raise V11DecodeError('Transaction without date')
+    sign = transaction['sign']
+    return V11Record(
+        code=CREDIT_CODE if sign > 0 else REVERSAL_CODE,
+        reference=transaction['reference'],
+        amount=sign * transaction['amount'],
+        cost=sign * transaction['cost'],
+        date=date,
+        count=None,
+    )
@@ -0,0 +1,246 @@
+# Copyright 2019 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+"""Decoding of the fixed-width records of V11 (ISR credit) files
+
+Each record type has a declared layout, compiled once into a
+:py:class:`struct.Struct`: a record is decoded by a single unpack and a
+conversion of the fields used by the import. Amounts and costs are
+integers, in cents.
+
+Records are recognized by their length:
+
+* type 3: 100 bytes, 87 bytes for the total record
+* type 4: 128 bytes, total record included
+"""
+import datetime
+import struct
+from collections import namedtuple
+from functools import lru_cache
+
+TOTAL_CODES = (b'999', b'995')
+
+V11Record = namedtuple('V11Record', (
+    'code',        # transaction code, e.g. '002' or '999'
+    'reference',   # ISR reference, None for a total record
+    'amount',      # amount in cents, negative for reversals
+    'cost',        # costs in cents, negative for reversals
+    'date',        # processing date (or date of the file for a total
+                   # record) as 'YYYY-MM-DD'
+    'count',       # number of records, None except for a total record
+))
+
+
+class V11DecodeError(ValueError):
+    """Record that cannot be decoded"""
+
+
+@lru_cache(maxsize=1024)
+def _date(value):
+    """Convert a YYMMDD or YYYYMMDD date to YYYY-MM-DD"""
+    if len(value) == 6:
+        year = int(value[:2])
+        # same pivot as time.strptime
+        year += 2000 if year < 69 else 1900
+        value = b'%d%s' % (year, value[2:])
+    date = datetime.date(int(value[:4]), int(value[4:6]), int(value[6:8]))
+    return date.isoformat()
+
+
+def _text(value):
+    return value.decode('ascii')
+
+
+# field converters, fields without converter are skipped
+CONVERTERS = {
+    'text': _text,
+    'int': int,
+    'date': _date,
+}
+
+# (name, size, kind), the kind being a key of CONVERTERS or None
+LAYOUTS = {
+    # type 3
+    'credit_3': (
+        ('code', 3, 'text'),
+        ('participant', 9, None),
+        ('reference', 27, 'text'),
+        ('amount', 10, 'int'),
+        ('submission_reference', 10, None),
+        ('submission_date', 6, None),
+        ('date', 6, 'date'),
+        ('credit_date', 6, None),
+        ('microfilm', 9, None),
+        ('reject_code', 1, None),
+        ('reserve', 9, None),
+        ('cost', 4, 'int'),
+    ),
+    'total_3': (
+        ('code', 3, 'text'),
+        ('participant', 9, None),
+        ('sort_key', 27, None),
+        ('amount', 12, 'int'),
+        ('count', 12, 'int'),
+        ('date', 6, 'date'),
+        ('cost', 9, 'int'),
+        ('reserve', 9, None),
+    ),
+    # type 4
+    'credit_4': (
+        ('code', 3, 'text'),
+        ('origin', 2, None),
+        ('delivery_type', 1, None),
+        ('participant', 9, None),
+        ('reference', 27, 'text'),
+        ('currency', 3, None),
+        ('amount', 12, 'int'),
+        ('submission_reference', 35, None),
+        ('submission_date', 8, None),
+        ('date', 8, 'date'),
+        ('credit_date', 8, None),
+        ('reject_code', 1, None),
+        ('cost_currency', 3, None),
+        ('cost', 6, 'int'),
+        ('reserve', 2, None),
+    ),
+    'total_4': (
+        ('code', 3, 'text'),
+        ('origin', 2, None),
+        ('delivery_type', 1, None),
+        ('participant', 9, None),
+        ('sort_key', 27, None),
+        ('currency', 3, None),
+        ('amount', 12, 'int'),
+        ('count', 12, 'int'),
+        ('date', 8, 'date'),
+        ('cost_currency', 3, None),
+        ('cost', 11, 'int'),
+        ('reserve', 37, None),
+    ),
+}
+
+# layout of the records by (length, is total)
+RECORD_LAYOUTS = {
+    (100, False): 'credit_3',
+    (87, True): 'total_3',
+    (128, False): 'credit_4',
+    (128, True): 'total_4',
+}
+
+
+class CompiledLayout(object):
+    """A record layout compiled into a :py:class:`struct.Struct`"""
+
+    def __init__(self, fields):
+        self.names = tuple(name for name, __, kind in fields if kind)
+        # position of the values of V11Record, None for missing fields
+        self.positions = tuple(
+            self.names.index(name) if name in self.names else None
+            for name in V11Record._fields
+        )
+        self.converters = tuple(
+            CONVERTERS[kind] for __, __, kind in fields if kind
+        )
+        self.struct = struct.Struct(''.join(
+            '%d%s' % (size, 's' if kind else 'x')
+            for __, size, kind in fields
+        ))
+        self.size = self.struct.size
+
+    def unpack(self, record):
+        """Return the converted values of the record, in the order of the
+        fields which are not skipped
+
+        :rtype: list
+        """
+        return [convert(value) for convert, value
+                in zip(self.converters, self.struct.unpack_from(record))]
+
+
+class V11Decoder(object):
+    """Decode V11 records with compiled layouts"""
+
+    def __init__(self, layouts=LAYOUTS, record_layouts=RECORD_LAYOUTS):
+        compiled = {name: CompiledLayout(fields)
+                    for name, fields in layouts.items()}
+        self.layouts = {key: compiled[name]
+                        for key, name in record_layouts.items()}
+        for (size, __), layout in self.layouts.items():
+            assert layout.size == size, 'wrong size of V11 layout'
+
+    def decode(self, record):
+        """Decode a record
+
+        :param record: raw record, without line break
+        :type record: bytes or memoryview
+
+        :rtype: :py:class:`V11Record`
+        """
+        is_total = bytes(record[:3]) in TOTAL_CODES
+        layout = self.layouts.get((len(record), is_total))
+        if layout is None:
+            raise V11DecodeError(
+                'Invalid record length %d: %r' % (len(record),
+                                                  bytes(record[:39])))
+        try:
+            values = layout.unpack(record)
+        except ValueError as err:
+            raise V11DecodeError(
+                'Invalid record %r: %s' % (bytes(record[:39]), err))
+        values = [None if position is None else values[position]
+                  for position in layout.positions]
+        # reversals: 005, 015, 025, ..., 995
+        if values[0][2] == '5':
+            values[2] = -values[2]
+            values[3] = -values[3]
+        return V11Record._make(values)
+
+
+decoder = V11Decoder()
+
+
+def split_records(line):
+    """Split a line holding several records, as in files without line
+    breaks between records
+
+    :param line: raw line, without line break
+    :type line: bytes
+
+    :return: raw records
+    :rtype: list of bytes
+    """
+    length = len(line)
+    if length <= 128:
+        return [line]
+    if (length - 87) % 100 == 0:
+        size = 100
+    elif length % 128 == 0:
+        size = 128
+    else:
+        raise V11DecodeError('Invalid record length: %r' % line[:128])
+    return [line[i:i + size] for i in range(0, length, size)]
+
+
+def iter_raw_records(stream):
+    """Read the raw records of a V11 file one by one
+
+    :param stream: content of the V11 file
+    :type stream: binary file object
+
+    :rtype: generator of bytes
+    """
+    for line in stream:
+        line = line.rstrip(b'\r\n')
+        if line:  # manage new line at end of file
+            yield from split_records(line)
+
+
+def decode_stream(stream):
+    """Decode the records of a V11 file
+
+    :param stream: content of the V11 file
+    :type stream: binary file object
+
+    :rtype: generator of :py:class:`V11Record`
+    """
+    for record in iter_raw_records(stream):
+        yield decoder.decode(record)
@@ -0,0 +1,193 @@
+# Copyright 2019 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+import base64
+import io
+import logging
+import zipfile
+
+from odoo import _, api, exceptions, fields, models
+
+_logger = logging.getLogger(__name__)
+
+
+class V11BulkImporterWizard(models.TransientModel):
+    """Import many V11 files at once
+
+    Files are read and imported one by one, each in its own bank
+    statement within a savepoint, so a file in error does not prevent the
+    import of the others.
+    """
+
+    _name = 'v11.bulk.import.wizard'
+    _description = 'Import of many V11 files'
+    # limits of the files extracted from a zip archive
+    _max_archive_files = 1000
+    _max_archive_size = 200 * 1024 * 1024
+
+    journal_id = fields.Many2one(
+        comodel_name='account.journal',
+        string='Bank Journal',
+        required=True,
+        domain=[('type', '=', 'bank')],
+        default=lambda self: self._default_journal_id(),
+    )
+    attachment_ids = fields.Many2many(
+        comodel_name='ir.attachment',
+        relation='v11_bulk_import_wizard_attachment_rel',
+        string='V11 Files',
+        help='V11 files, or zip archives of V11 files',
+    )
+    state = fields.Selection(
+        [('draft', 'Draft'),
+         ('done', 'Done')],
+        default='draft',
+    )
+    summary = fields.Text(readonly=True)
+
+    @api.model
+    def _default_journal_id(self):
+        if self.env.context.get('active_model') == 'account.journal':
+            return self.env.context.get('active_id')
+        return False
+
+    @api.multi
+    def _iter_files(self):
+        """Read the files to import one by one, zip archives being
+        extracted
+
+        Files are returned in the order of their upload.
+
+        :return: generator of the name and content of each file
+        :rtype: generator of tuple
+        """
+        self.ensure_one()
+        for attachment in self.attachment_ids.sorted('id'):
+            name = attachment.datas_fname or attachment.name
+            content = base64.b64decode(attachment.datas or b'')
+            if not zipfile.is_zipfile(io.BytesIO(content)):
+                yield name, content
+                continue
+            yield from self._iter_archive(name, content)
+
+    @api.model
+    def _iter_archive(self, name, content):
+        """Extract the files of a zip archive one by one
+
+        The number of files and their total size are limited, the sizes
+        declared by the archive are not trusted.
+
+        :return: generator of the name and content of each file
+        :rtype: generator of tuple
+        """
+        too_large = _('The files of the archive %s are too large.') % name
+        try:
+            with zipfile.ZipFile(io.BytesIO(content)) as archive:
+                members = [member for member in archive.infolist()
+                           if not member.filename.endswith('/')]
+                if len(members) > self._max_archive_files:
+                    raise exceptions.UserError(
+                        _('The archive %s holds more than %d files.')
+                        % (name, self._max_archive_files))
+                remaining = self._max_archive_size
+                for member in members:
+                    if member.file_size > remaining:
+                        raise exceptions.UserError(too_large)
+                    with archive.open(member) as member_file:
+                        member_content = member_file.read(remaining + 1)
+                    remaining -= len(member_content)
+                    if remaining < 0:
+                        raise exceptions.UserError(too_large)
+                    yield '%s/%s' % (name, member.filename), member_content
+        except zipfile.BadZipFile as err:
+            raise exceptions.UserError(
+                _('The archive %s cannot be read: %s') % (name, err))
+
+    @api.multi
+    def _get_statement(self, name):
+        """Return the open statement of a file, created if needed
+
+        :param name: name of the file
+        :type name: str
+
+        :rtype: :py:class:`openerp.models.Models` record
+        """
+        self.ensure_one()
+        statement_obj = self.env['account.bank.statement']
+        statement = statement_obj.search([
+            ('journal_id', '=', self.journal_id.id),
+            ('name', '=', name),
+            ('state', '=', 'open'),
+        ], limit=1)
+        if not statement:
+            statement = statement_obj.create({
+                'journal_id': self.journal_id.id,
+                'name': name,
+            })
+        return statement
+
+    @api.multi
+    def _import_file(self, name, content):
+        """Import the records of a file in its statement
+
+        Records are parsed while they are imported. Files already
+        imported are refused, records already imported are skipped.
+
+        :return: statement, number of created statement lines and number
+                 of skipped records
+        :rtype: tuple
+        """
+        self.ensure_one()
+        hash_obj = self.env['v11.import.hash']
+        importer = self.env['v11.import.wizard'].create({})
+        file_hash = hash_obj._file_hash(io.BytesIO(content))
+        importer._check_file_not_imported(file_hash,
+                                          self.journal_id.company_id)
+        records = importer._iter_file_records(
+            io.BufferedReader(io.BytesIO(content)))
+        statement = self._get_statement(name)
+        count, skipped = importer._import_records(statement, records)
+        hash_obj._register([file_hash], 'file', statement)
+        importer._report_skipped(statement, skipped)
+        importer._attach_file(statement, base64.b64encode(content))
+        return statement, count, len(skipped)
+
+    @api.multi
+    def import_files(self):
+        """Import the V11 files, each in its own statement
+
+        :returns: action dict showing the summary of the import
+        :rtype: dict
+        """
+        self.ensure_one()
+        summary = []
+        for name, content in self._iter_files():
+            try:
+                # a file in error does not prevent the import of the others
+                with self.env.cr.savepoint():
+                    statement, count, skipped = self._import_file(
+                        name, content)
+            except (exceptions.UserError, exceptions.ValidationError) as err:
+                # drop the cached values of the rolled back records
+                self.env.clear()
+                summary.append(_('%s: not imported, %s') % (name, err.name))
+                continue
+            summary.append(_('%s: %d lines imported in statement %s')
+                           % (name, count, statement.name))
+            if skipped:
+                summary[-1] += _(', %d records already imported skipped') % (
+                    skipped)
+        if not summary:
+            raise exceptions.UserError(
+                _('Please select a file first!')
+            )
+        self.write({
+            'state': 'done',
+            'summary': '\n'.join(summary),
+        })
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
@@ -1,22 +1,99 @@
 # Copyright 2018 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 import base64
+import io
 import time
 
+from lxml import etree
+
 from odoo import _, api, exceptions, fields, models
-from odoo.tools.misc import mod10r
+from odoo.tools import split_every
+from odoo.addons.l10n_ch_base_bank.tools.checksum import mod10r
+
+from ..tools import camt054_parser, v11_decoder
+
+# bytes of base64 read at once, multiple of 4
+READ_SIZE = 64 * 1024
+
+
+class Base64Reader(io.RawIOBase):
+    """Read base64 encoded data as a binary stream
+
+    The data is decoded by chunks when the stream is read, so the decoded
+    content is never entirely in memory. Line breaks in the encoded data
+    are ignored.
+    """
+
+    def __init__(self, data, read_size=READ_SIZE):
+        super().__init__()
+        if isinstance(data, str):
+            data = data.encode('ascii')
+        self._data = data
+        self._read_size = read_size
+        self._position = 0
+        self._encoded = b''
+        self._decoded = b''
+
+    def readable(self):
+        return True
+
+    def _decode_chunk(self):
+        chunk = self._data[self._position:self._position + self._read_size]
+        self._position += len(chunk)
+        encoded = self._encoded + b''.join(chunk.split())
+        if self._position >= len(self._data):
+            size = len(encoded)
+        else:
+            size = len(encoded) - len(encoded) % 4
+        self._encoded = encoded[size:]
+        self._decoded = base64.b64decode(encoded[:size])
+
+    def readinto(self, buffer):
+        while not self._decoded and self._position < len(self._data):
+            self._decode_chunk()
+        size = min(len(buffer), len(self._decoded))
+        buffer[:size] = self._decoded[:size]
+        self._decoded = self._decoded[size:]
+        return size
 
 
 class V11ImporterWizard(models.TransientModel):
 
     _name = 'v11.import.wizard'
     _total_line_codes = ('999', '995')
+    # default number of records turned into statement lines at once
+    _import_chunk_size = 1000
+    # number of skipped records listed on the statement
+    _reported_skipped_size = 100
 
-    v11file = fields.Binary('V11 File')
+    v11file = fields.Binary(
+        'V11 File',
+        help='V11 file or camt.054 ISR credit notification',
+    )
     v11file_name = fields.Char('Name')
     total_cost = fields.Float('Total cost of V11')
     total_amount = fields.Float('Total amount of V11')
 
+    @api.model
+    def _decode_line(self, line):
+        """Decode a raw v11 line
+        :param line: raw v11 line, without line break
+        :type line: bytes or str
+
+        :return: decoded line
+        :rtype: :py:class:`V11Record`
+        """
+        try:
+            if isinstance(line, str):
+                line = line.encode('ascii')
+            return v11_decoder.decoder.decode(line)
+        except ValueError as decode_err:
+            raise exceptions.UserError(_(
+                'V11 file can not be decoded,it contains invalid character {}'
+            ).format(
+                repr(decode_err)
+            ))
+
     @api.model
     def _get_line_amount(self, line, sum_amount=True):
         """Returns the V11 line amount value
@@ -29,12 +106,7 @@ class V11ImporterWizard(models.TransientModel):
         :return: current line amount
         :rtype: float
         """
-        if line[0:3] in self._total_line_codes:
-            amount = float(line[39:51]) / 100.0
-        else:
-            amount = float(line[39:49]) / 100.0
-        if line[2] == '5':
-            amount *= -1
+        amount = self._decode_line(line).amount / 100.0
         if sum_amount:
             self.total_amount += amount
         return amount
@@ -61,12 +133,7 @@ class V11ImporterWizard(models.TransientModel):
         :return: current line cost
         :rtype: float
         """
-        if line[0:3] in self._total_line_codes:
-            cost = float(line[69:78]) / 100.0
-        else:
-            cost = float(line[96:100]) / 100.0
-        if line[2] == '5':
-            cost *= -1
+        cost = self._decode_line(line).cost / 100.0
         if sum_cost:
             self.total_cost += cost
         return cost
@@ -82,25 +149,19 @@ class V11ImporterWizard(models.TransientModel):
             )
 
     @api.model
-    def _create_record(self, line):
-        """Create a v11 record dict
-        :param line: raw v11 line
-        :type line: str
+    def _prepare_record(self, decoded):
+        """Create a v11 record dict from a decoded line
+        :param decoded: decoded v11 line
+        :type decoded: :py:class:`V11Record`
 
         :return: current line dict representation
         :rtype: dict
-
         """
-        amount = self._get_line_amount(line)
-        cost = self._get_line_cost(line)
         record = {
-            'reference': line[12:39],
-            'amount': amount,
-            'date': time.strftime(
-                '%Y-%m-%d',
-                time.strptime(line[65:71], '%y%m%d')
-            ),
-            'cost': cost,
+            'reference': decoded.reference,
+            'amount': decoded.amount / 100.0,
+            'date': decoded.date,
+            'cost': decoded.cost / 100.0,
         }
 
         if record['reference'] != mod10r(record['reference'][:-1]):
@@ -111,49 +172,197 @@ class V11ImporterWizard(models.TransientModel):
         return record
 
     @api.model
-    def _parse_lines(self, inlines):
-        """Parses raw v11 line and populate records list with dict
+    def _create_record(self, line):
+        """Create a v11 record dict
+        :param line: raw v11 line
+        :type line: str
 
-        :param inlines: string buffer of the V11 file
-        :type inlines: str
+        :return: current line dict representation
+        :rtype: dict
 
-        :return: list of dict representing a v11 entry
-        :rtype: list of dict
         """
-        records = []
+        return self._prepare_record(self._decode_line(line))
+
+    @api.model
+    def _split_records(self, line):
+        """Split a line holding several records, as in files without line
+        breaks between records
+
+        Records of type 3 have 100 bytes and the total record 87 bytes,
+        records of type 4 have 128 bytes.
+
+        :param line: raw v11 line, without line break
+        :type line: bytes
+
+        :return: raw v11 records
+        :rtype: list of bytes
+        """
+        try:
+            return v11_decoder.split_records(line)
+        except v11_decoder.V11DecodeError:
+            raise exceptions.UserError(
+                _('Invalid record length: %s') % line[:128].decode(
+                    'ascii', 'replace')
+            )
+
+    @api.model
+    def _iter_lines(self, stream):
+        """Read the raw records of a V11 file one by one
+
+        :param stream: content of the V11 file
+        :type stream: binary file object
+
+        :return: generator of raw v11 records
+        :rtype: generator of bytes
+        """
+        while True:
+            try:
+                line = stream.readline()
+            except ValueError as decode_err:
+                raise exceptions.UserError(_(
+                    'V11 file can not be decoded,it contains invalid '
+                    'character {}'
+                ).format(
+                    repr(decode_err)
+                ))
+            if not line:
+                break
+            line = line.rstrip(b'\r\n')
+            if line:  # manage new line at end of file
+                yield from self._split_records(line)
+
+    @api.model
+    def _iter_camt054_lines(self, stream):
+        """Parse the transactions of a camt.054 file one by one
+
+        :param stream: content of the camt.054 file
+        :type stream: binary file object
+
+        :return: generator of transactions decoded as v11 lines
+        :rtype: generator of :py:class:`V11Record`
+        """
+        transactions = camt054_parser.iter_records(stream)
+        while True:
+            try:
+                decoded = next(transactions)
+            except StopIteration:
+                return
+            except (ValueError, etree.LxmlError) as parse_err:
+                raise exceptions.UserError(_(
+                    'camt.054 file can not be parsed: {}'
+                ).format(
+                    parse_err
+                ))
+            yield decoded
+
+    @api.model
+    def _iter_records(self, inlines):
+        """Parse raw v11 lines one by one
+
+        Totals are computed while parsing and validated against the total
+        record, which must be the last one.
+
+        :param inlines: raw v11 lines, line breaks are ignored
+        :type inlines: iterable of bytes or str
+
+        :return: generator of dict representing a v11 entry
+        :rtype: generator of dict
+        """
+        decoded_lines = (
+            self._decode_line(line) for line in (
+                line.rstrip(b'\r\n' if isinstance(line, bytes) else '\r\n')
+                for line in inlines
+            )
+            if line  # manage new line at end of file
+        )
+        return self._iter_decoded_records(decoded_lines)
+
+    @api.model
+    def _iter_decoded_records(self, decoded_lines):
+        """Validate decoded v11 lines one by one
+
+        Totals are computed while iterating and validated against the
+        total record, which must be the last one.
+
+        :param decoded_lines: decoded v11 lines
+        :type decoded_lines: iterable of :py:class:`V11Record`
+
+        :return: generator of dict representing a v11 entry
+        :rtype: generator of dict
+        """
+        count = 0
+        # in cents
+        total_amount = total_cost = 0
         find_total = False
-        for lines in inlines:
-            if not lines:  # manage new line at end of file
-                continue
-            (line, lines) = (lines[:128], lines[128:])
-            record = {}
+        for decoded in decoded_lines:
+            if find_total:
+                raise exceptions.UserError(
+                    _('Record found after total record')
+                )
             # If line is a validation line
-            if line[0:3] in self._total_line_codes:
-                if find_total:
-                    raise exceptions.UserError(
-                        _('Too many total record found!')
-                    )
+            if decoded.count is not None:
                 find_total = True
-                if lines:
-                    raise exceptions.UserError(
-                        _('Record found after total record')
-                    )
-                if int(line[51:63]) != len(records):
+                if decoded.count != count:
                     raise exceptions.UserError(
                         _('Number of records differ from the computed one')
                     )
                 # Validaton of amount and costs
-                amount = self._get_line_amount(line, sum_amount=False)
-                cost = self._get_line_cost(line, sum_cost=False)
-                self._validate_total_amount(amount)
-                self._validate_total_cost(cost)
+                self.total_amount = total_amount / 100.0
+                self.total_cost = total_cost / 100.0
+                self._validate_total_amount(decoded.amount / 100.0)
+                self._validate_total_cost(decoded.cost / 100.0)
             else:
-                record = self._create_record(line)
-                records.append(record)
-        return records
+                record = self._prepare_record(decoded)
+                count += 1
+                total_amount += decoded.amount
+                total_cost += decoded.cost
+                yield record
 
     @api.model
-    def _prepare_line_vals(self, statement, record):
+    def _parse_lines(self, inlines):
+        """Parses raw v11 line and populate records list with dict
+
+        :param inlines: string buffer of the V11 file
+        :type inlines: str
+
+        :return: list of dict representing a v11 entry
+        :rtype: list of dict
+        """
+        return list(self._iter_records(inlines))
+
+    @api.model
+    def _match_references(self, references):
+        """Find the open receivable/payable move lines of references
+
+        All the references are searched at once, their partners and
+        invoices are read at once as well.
+
+        :param references: ISR references
+        :type references: iterable of str
+
+        :returns: move line by reference, references without move line
+                  are not in it
+        :rtype: dict
+        """
+        lines = self.env['account.move.line'].search(
+            [('transaction_ref', 'in', list(set(references))),
+             ('reconciled', '=', False),
+             ('account_id.user_type_id.type', 'in', ['receivable', 'payable']),
+             ('journal_id.type', '=', 'sale')],
+        )
+        matches = {}
+        for line in lines:
+            reference = line.transaction_ref
+            if reference in matches:
+                raise exceptions.UserError(
+                    _("Too many receivable/payable lines for reference %s")
+                    % reference)
+            matches[reference] = line
+        lines.mapped('invoice_id.number')
+        return matches
+
+    @api.model
+    def _prepare_line_vals(self, statement, record, matches=None):
         """Compute bank statement values to be used by `models.Model.create'
         :param statement: current statement record
         :type statement: :py:class:`openerp.models.Models` record
@@ -161,13 +370,18 @@ class V11ImporterWizard(models.TransientModel):
         :param record: dict reprenting parsed V11 line
         :type record: dict
 
+        :param matches: move lines by reference as returned by
+                        `_match_references`, searched if not given
+        :type matches: dict
+
         :returns: values
         :rtype: dict
         """
         # Remove the 11 first char because it can be adherent number
         # TODO check if 11 is the right number
-        move_line_obj = self.env['account.move.line']
         reference = record['reference']
+        if matches is None:
+            matches = self._match_references([reference])
         values = {
             'name': reference or '/',
             'date': record['date'],
@@ -175,17 +389,7 @@ class V11ImporterWizard(models.TransientModel):
             'ref': '/',
             'statement_id': statement.id,
         }
-        line = move_line_obj.search(
-            [('transaction_ref', '=', reference),
-             ('reconciled', '=', False),
-             ('account_id.user_type_id.type', 'in', ['receivable', 'payable']),
-             ('journal_id.type', '=', 'sale')],
-            order='date desc',
-        )
-        if len(line) > 1:
-            raise exceptions.UserError(
-                _("Too many receivable/payable lines for reference %s")
-                % reference)
+        line = matches.get(reference)
         if line:
             # transaction_ref is propagated on all lines
             partner_id = line.partner_id.id
@@ -194,14 +398,73 @@ class V11ImporterWizard(models.TransientModel):
             values['partner_id'] = partner_id
         return values
 
+    @api.model
+    def _get_import_chunk_size(self):
+        """Return the number of records turned into statement lines at once
+
+        Set by the system parameter `isr.v11.import.chunk.size`.
+
+        :rtype: int
+        """
+        config_param = self.env['ir.config_parameter'].sudo()
+        size = config_param.get_param('isr.v11.import.chunk.size',
+                                      self._import_chunk_size)
+        try:
+            size = int(size)
+        except ValueError:
+            size = self._import_chunk_size
+        return max(size, 1)
+
+    @api.model
+    def _create_statement_lines(self, statement, records):
+        """Create the statement lines of parsed V11 records
+
+        The create of statement lines is a single record one, so each line
+        is still inserted on its own. What is saved is the recomputation
+        of the computed fields, done once for all the lines instead of
+        after each of them.
+
+        :param statement: current statement record
+        :type statement: :py:class:`openerp.models.Models` record
+
+        :param records: dicts reprenting parsed V11 lines
+        :type records: list of dict
+
+        :returns: created statement lines
+        :rtype: :py:class:`openerp.models.Models` recordset
+        """
+        matches = self._match_references(
+            [record['reference'] for record in records]
+        )
+        values = [self._prepare_line_vals(statement, record, matches)
+                  for record in records]
+        with self.env.norecompute():
+            lines = self.env['account.bank.statement.line'].create(values)
+        lines.recompute()
+        return lines
+
+    @api.model
+    def _iter_file_records(self, stream):
+        """Parse the records of a V11 or camt.054 file one by one
+
+        :param stream: content of the file
+        :type stream: buffered binary file object
+
+        :return: generator of dict representing a v11 entry
+        :rtype: generator of dict
+        """
+        if camt054_parser.is_camt054(stream.peek(64)):
+            return self._iter_decoded_records(
+                self._iter_camt054_lines(stream)
+            )
+        return self._iter_records(self._iter_lines(stream))
+
     def _import_v11(self):
         """Import v11 file and transfor it into statement lines
 
         :returns: action dict
         :rtype: dict
         """
-        statement_line_obj = self.env['account.bank.statement.line']
-        attachment_obj = self.env['ir.attachment']
         statement_obj = self.env['account.bank.statement']
         v11file = self.v11file
         if not v11file:
@@ -211,27 +474,121 @@ class V11ImporterWizard(models.TransientModel):
         statement_id = self.env.context.get('active_id')
         if not statement_id:
             raise ValueError('The id of current satement is not in statement')
-        try:
-            lines = str(base64.decodebytes(v11file), 'utf-8').split("\r\n")
-        except ValueError as decode_err:
-            raise exceptions.UserError(_(
-                'V11 file can not be decoded,it contains invalid character {}'
-            ).format(
-                repr(decode_err)
-            ))
-        records = self._parse_lines(lines)
-
         statement = statement_obj.browse(statement_id)
-        for record in records:
-            values = self._prepare_line_vals(statement,
-                                             record)
-            statement_line_obj.create(values)
-        attachment_obj.create(
+        hash_obj = self.env['v11.import.hash']
+        file_hash = hash_obj._file_hash(
+            io.BufferedReader(Base64Reader(v11file), READ_SIZE)
+        )
+        self._check_file_not_imported(file_hash, statement.company_id)
+        stream = io.BufferedReader(Base64Reader(v11file), READ_SIZE)
+        records = self._iter_file_records(stream)
+        __, skipped = self._import_records(statement, records)
+        hash_obj._register([file_hash], 'file', statement)
+        self._report_skipped(statement, skipped)
+        self._attach_file(statement, self.v11file)
+        return {}
+
+    @api.model
+    def _check_file_not_imported(self, file_hash, company):
+        """Refuse a file already imported in a company
+
+        :param file_hash: hash of the content of the file
+        :type file_hash: str
+
+        :param company: company of the import
+        :type company: :py:class:`openerp.models.Models` record
+        """
+        hash_obj = self.env['v11.import.hash']
+        if hash_obj._find_existing([file_hash], company):
+            raise exceptions.UserError(
+                _('This V11 file has already been imported')
+            )
+
+    @api.model
+    def _report_skipped(self, statement, skipped):
+        """Post the records skipped as already imported on the statement
+
+        :param statement: current statement record
+        :type statement: :py:class:`openerp.models.Models` record
+
+        :param skipped: dicts reprenting the skipped V11 lines
+        :type skipped: list of dict
+        """
+        if not skipped:
+            return
+        lines = ''.join(
+            '<li>%s %.2f %s</li>' % (record['reference'], record['amount'],
+                                     record['date'])
+            for record in skipped[:self._reported_skipped_size]
+        )
+        if len(skipped) > self._reported_skipped_size:
+            lines += '<li>...</li>'
+        statement.message_post(body=_(
+            '%d V11 records already imported were skipped:<ul>%s</ul>'
+        ) % (len(skipped), lines))
+
+    @api.model
+    def _import_records(self, statement, records):
+        """Create the statement lines of parsed V11 records by chunks
+
+        :param statement: current statement record
+        :type statement: :py:class:`openerp.models.Models` record
+
+        :param records: dicts reprenting parsed V11 lines
+        :type records: iterable of dict
+
+        Records already imported in the company of the statement, from
+        this file or another one, are skipped. Identical records of a same
+        file are all imported.
+
+        :returns: number of created statement lines and skipped records
+        :rtype: tuple(int, list of dict)
+        """
+        hash_obj = self.env['v11.import.hash']
+        company = statement.company_id
+        occurrences = {}
+        count = 0
+        skipped = []
+        for chunk in split_every(self._get_import_chunk_size(), records):
+            hashes = []
+            for record in chunk:
+                key = (record['reference'], record['amount'],
+                       record['date'], record['cost'])
+                occurrence = occurrences.get(key, 0)
+                occurrences[key] = occurrence + 1
+                hashes.append(hash_obj._record_hash(record, occurrence))
+            existing = hash_obj._find_existing(hashes, company)
+            new_records = []
+            new_hashes = []
+            for record, record_hash in zip(chunk, hashes):
+                if record_hash in existing:
+                    skipped.append(record)
+                else:
+                    new_records.append(record)
+                    new_hashes.append(record_hash)
+            if new_records:
+                count += len(
+                    self._create_statement_lines(statement, new_records)
+                )
+                hash_obj._register(new_hashes, 'record', statement)
+        return count, skipped
+
+    @api.model
+    def _attach_file(self, statement, datas):
+        """Store an imported file as attachment of the statement
+
+        :param statement: current statement record
+        :type statement: :py:class:`openerp.models.Models` record
+
+        :param datas: content of the file, base64 encoded
+        :type datas: bytes
+        """
+        self.env['ir.attachment'].create(
             {
                 'name': 'V11 %s' % time.strftime(
                     "%Y-%m-%d_%H:%M:%S", time.gmtime()
                 ),
-                'datas': self.v11file,
+                'datas': datas,
                 'datas_fname': 'ISR %s.txt' % time.strftime(
                     "%Y-%m-%d_%H:%M:%S", time.gmtime()
                 ),
@@ -240,8 +597,6 @@ class V11ImporterWizard(models.TransientModel):
             },
         )
 
-        return {}
-
     @api.multi
     def import_v11(self):
         """Import v11 file and transfor it into statement lines
@@ -2,7 +2,7 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 {'name': 'Switzerland - ISR inpayment slip (PVR/BVR/ESR)',
  'summary': 'Print inpayment slip from your invoices',
- 'version': '12.0.2.1.0',
+ 'version': '12.0.2.2.0',
  'author': "Camptocamp,Odoo Community Association (OCA)",
  'category': 'Localization',
  'website': 'https://github.com/OCA/l10n-switzerland',
@@ -19,9 +19,11 @@
      "views/bank.xml",
      "views/account_invoice.xml",
      "views/res_config_settings_views.xml",
+     "views/isr_batch_print_job.xml",
      "wizard/isr_batch_print.xml",
      "report/report_declaration.xml",
-     "security/ir.model.access.csv"
+     "security/ir.model.access.csv",
+     "data/ir_cron.xml",
  ],
  'auto_install': False,
  'installable': True,
@@ -2,9 +2,13 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
 
 
+import os
+
+from werkzeug.wsgi import wrap_file
+
 from odoo.models import _
 from odoo.addons.web.controllers import main as report
-from odoo.http import content_disposition, request, route
+from odoo.http import Response, content_disposition, request, route
 
 
 class ReportController(report.ReportController):
@@ -23,6 +27,22 @@ class ReportController(report.ReportController):
                     else '{0:05d}'.format(invoice_id[0]),
                     '.pdf'
                 ])
+            if invoice_id and not report_slip.attachment:
+                # stream the document from disk instead of holding it
+                # in the response
+                pdfreport = report_slip._render_reportlab_pdf_file(
+                    invoice_id)
+                pdfhttpheaders = [
+                    ('Content-Type', 'application/pdf'),
+                    ('Content-Disposition', content_disposition(filename)),
+                    ('Content-Length',
+                     os.fstat(pdfreport.fileno()).st_size),
+                ]
+                return Response(
+                    wrap_file(request.httprequest.environ, pdfreport),
+                    headers=pdfhttpheaders,
+                    direct_passthrough=True,
+                )
             data, format_report = report_slip.render(invoice_id)
             pdfhttpheaders = [
                 ('Content-Type', 'application/pdf'),
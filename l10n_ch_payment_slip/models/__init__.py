@@ -3,3 +3,4 @@ from . import payment_slip
 from . import invoice
 from . import bank
 from . import res_config_settings
+from . import isr_batch_print_job
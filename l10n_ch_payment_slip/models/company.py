@@ -76,6 +76,15 @@ class ResCompany(models.Model):
         required=True,
         default="in_memory"
     )
+    slip_render_workers = fields.Integer(
+        'Payment Slips Rendering Processes',
+        default=1,
+        help='Number of processes used to render large batches of payment '
+             'slips. Keep 1 to render them in the current process. Only '
+             'used by the workers of a server running in prefork mode, as '
+             'forking a multi-threaded server may block the rendering '
+             'processes.',
+    )
     isr_background = fields.Boolean(
         'Insert ISR background ?',
         oldname='bvr_background',
@@ -1,6 +1,9 @@
 # Copyright 2012-2019 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+import warnings
+
 from odoo import _, api, exceptions, fields, models
+from odoo.tools import split_every
 
 from odoo.addons.l10n_ch_base_bank.models.bank import pretty_l10n_ch_postal
 
@@ -128,38 +131,113 @@ class AccountInvoice(models.Model):
     def get_payment_move_line(self):
         """Return the move line related to current invoice slips
 
+        Deprecated, use :py:meth:`_get_payment_move_lines`, which works on
+        many invoices.
+
         :return: recordset of `account.move.line`
         :rtype: :py:class:`openerp.model.Models`
         """
-        move_line_model = self.env['account.move.line']
-        return move_line_model.search(
-            [('move_id', '=', self.move_id.id),
+        warnings.warn('get_payment_move_line is deprecated, use '
+                      '_get_payment_move_lines',
+                      DeprecationWarning, stacklevel=2)
+        return self._get_payment_move_lines()
+
+    @api.multi
+    def _get_payment_move_lines(self):
+        """Return the move lines related to the slips of all the invoices
+
+        Lines are searched at once and kept in the order of the invoices.
+
+        :return: recordset of `account.move.line`
+        :rtype: :py:class:`openerp.model.Models`
+        """
+        moves = self.mapped('move_id')
+        if not moves:
+            return self.env['account.move.line'].browse()
+        move_lines = self.env['account.move.line'].search(
+            [('move_id', 'in', moves.ids),
              ('account_id.user_type_id.type', 'in',
               ['receivable', 'payable'])]
         )
+        position = {move.id: index for index, move in enumerate(moves)}
+        return move_lines.sorted(key=lambda line: position[line.move_id.id])
 
     @api.model
     def _update_ref_on_account_analytic_line(self, ref, move_id):
-        """Propagate reference on analytic line"""
-        self.env.cr.execute(
-            'UPDATE account_analytic_line SET ref=%s'
-            '   FROM account_move_line '
-            ' WHERE account_move_line.move_id = %s '
-            '   AND account_analytic_line.move_id = account_move_line.id',
-            (ref, move_id)
-        )
+        """Propagate reference on analytic line
+
+        Kept for the callers working on a single move, override
+        :py:meth:`_update_ref_on_account_analytic_lines`, which is the one
+        called when invoices are validated.
+        """
+        return self._update_ref_on_account_analytic_lines([(ref, move_id)])
+
+    @api.model
+    def _update_ref_on_account_analytic_lines(self, ref_moves):
+        """Propagate references on analytic lines
+
+        :param ref_moves: pairs of reference and id of `account.move`, the
+                          analytic lines of the move get the reference
+        :type ref_moves: list of tuple
+        """
+        cr = self.env.cr
+        analytic_line_ids = []
+        for chunk in split_every(1000, ref_moves):
+            cr.execute(
+                'UPDATE account_analytic_line AS aal SET ref = v.ref'
+                '  FROM account_move_line AS aml,'
+                '       (VALUES %s) AS v(ref, move_id)'
+                ' WHERE aml.move_id = v.move_id'
+                '   AND aal.move_id = aml.id'
+                ' RETURNING aal.id' % ', '.join(['(%s, %s)'] * len(chunk)),
+                [value for pair in chunk for value in pair]
+            )
+            analytic_line_ids += [row[0] for row in cr.fetchall()]
+        if analytic_line_ids:
+            self.env['account.analytic.line'].invalidate_cache(
+                ['ref'], analytic_line_ids)
         return True
 
     @api.model
     def _action_isr_number_move_line(self, move_line, ref):
         """Propagate reference on move lines and analytic lines"""
-        if not ref:
+        self._action_isr_number_move_lines([(move_line, ref)])
+
+    @api.model
+    def _action_isr_number_move_lines(self, line_refs):
+        """Propagate references on move lines and analytic lines
+
+        References are written with one query per table and chunk, and
+        only the written fields of the updated records are invalidated.
+        As for a single line, analytic lines of a move get the reference
+        of its last given move line.
+
+        :param line_refs: pairs of `account.move.line` record and reference,
+                          lines without reference are left untouched
+        :type line_refs: list of tuple
+        """
+        refs_by_line = {}
+        refs_by_move = {}
+        for move_line, ref in line_refs:
+            if not ref:
+                continue
+            ref = ref.replace(' ', '')  # remove formatting
+            refs_by_line[move_line.id] = ref
+            refs_by_move[move_line.move_id.id] = ref
+        if not refs_by_line:
             return
-        ref = ref.replace(' ', '')  # remove formatting
-        self.env.cr.execute('UPDATE account_move_line SET transaction_ref=%s'
-                            '  WHERE id=%s', (ref, move_line.id))
-        self._update_ref_on_account_analytic_line(ref, move_line.move_id.id)
-        self.env.cache.invalidate()
+        cr = self.env.cr
+        for chunk in split_every(1000, list(refs_by_line.items())):
+            cr.execute(
+                'UPDATE account_move_line AS aml SET transaction_ref = v.ref'
+                '  FROM (VALUES %s) AS v(id, ref)'
+                ' WHERE aml.id = v.id' % ', '.join(['(%s, %s)'] * len(chunk)),
+                [value for pair in chunk for value in pair]
+            )
+        self.env['account.move.line'].invalidate_cache(
+            ['transaction_ref'], list(refs_by_line))
+        self._update_ref_on_account_analytic_lines(
+            [(ref, move_id) for move_id, ref in refs_by_move.items()])
 
     @api.multi
     def invoice_validate(self):
@@ -173,21 +251,24 @@ class AccountInvoice(models.Model):
 
         """
         pay_slip = self.env['l10n_ch.payment_slip']
-        for inv in self:
-            if inv.type in ('in_invoice', 'in_refund'):
-                if inv._is_isr_reference():
-                    ref = inv.reference
-                else:
-                    ref = False
-                move_lines = inv.get_payment_move_line()
-                for move_line_id in move_lines:
-                    self._action_isr_number_move_line(move_line_id,
-                                                      ref)
-            else:
-                for pay_slip in pay_slip._compute_pay_slips_from_invoices(inv):
-                    ref = pay_slip.reference
-                    self._action_isr_number_move_line(pay_slip.move_line_id,
-                                                      ref)
+        supplier_invoices = self.filtered(
+            lambda inv: inv.type in ('in_invoice', 'in_refund'))
+        customer_invoices = self - supplier_invoices
+        line_refs = []
+        if supplier_invoices:
+            refs_by_move = {
+                inv.move_id.id: inv.reference
+                for inv in supplier_invoices if inv._is_isr_reference()
+            }
+            for move_line in supplier_invoices._get_payment_move_lines():
+                line_refs.append(
+                    (move_line, refs_by_move.get(move_line.move_id.id)))
+        if customer_invoices:
+            pay_slips = pay_slip._compute_pay_slips_from_invoices(
+                customer_invoices)
+            for slip in pay_slips:
+                line_refs.append((slip.move_line_id, slip.reference))
+        self._action_isr_number_move_lines(line_refs)
         return super(AccountInvoice, self).invoice_validate()
 
     @api.multi
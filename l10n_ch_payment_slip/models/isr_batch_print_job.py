@@ -0,0 +1,213 @@
+# Copyright 2019 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+import base64
+import io
+import logging
+
+from odoo import _, api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+REPORT_NAME = 'l10n_ch_payment_slip.one_slip_per_page_from_invoice'
+
+
+class ISRBatchPrintJob(models.Model):
+    """Payment slips printed in background
+
+    Invoices are rendered by chunks from a cron. Each rendered chunk is
+    committed as an attachment of the job, so a job interrupted by a
+    crash or a restart resumes after the last rendered chunk. Once all
+    the chunks are rendered they are merged in a single attachment.
+    """
+
+    _name = 'isr.batch.print.job'
+    _description = 'Payment slips printed in background'
+    _order = 'id desc'
+
+    name = fields.Char(required=True, readonly=True)
+    user_id = fields.Many2one(
+        comodel_name='res.users',
+        string='Requested by',
+        required=True,
+        readonly=True,
+        default=lambda self: self.env.user,
+    )
+    company_id = fields.Many2one(
+        comodel_name='res.company',
+        required=True,
+        readonly=True,
+        default=lambda self: self.env.user.company_id,
+    )
+    invoice_ids = fields.Many2many(
+        comodel_name='account.invoice',
+        relation='isr_batch_print_job_invoice_rel',
+        string='Invoices',
+        readonly=True,
+    )
+    state = fields.Selection(
+        [('pending', 'Pending'),
+         ('done', 'Done'),
+         ('failed', 'Failed')],
+        required=True,
+        readonly=True,
+        default='pending',
+    )
+    chunk_size = fields.Integer(
+        required=True,
+        readonly=True,
+        default=500,
+        help='Number of invoices rendered at once',
+    )
+    chunk_count = fields.Integer(compute='_compute_progress')
+    done_chunk_count = fields.Integer(compute='_compute_progress')
+    progress = fields.Float(compute='_compute_progress')
+    attachment_id = fields.Many2one(
+        comodel_name='ir.attachment',
+        string='Payment slips',
+        readonly=True,
+    )
+    error_message = fields.Text('Errors', readonly=True)
+
+    @api.depends('invoice_ids', 'chunk_size', 'state')
+    def _compute_progress(self):
+        for job in self:
+            size = max(job.chunk_size, 1)
+            chunk_count = -(-len(job.invoice_ids) // size)
+            if job.state == 'done':
+                done_chunk_count = chunk_count
+            else:
+                done_chunk_count = len(job._get_chunk_attachments())
+            job.chunk_count = chunk_count
+            job.done_chunk_count = done_chunk_count
+            job.progress = (
+                100.0 * done_chunk_count / chunk_count if chunk_count else 0.0
+            )
+
+    @api.multi
+    def _get_chunk_attachments(self):
+        """Return the attachments of the chunks already rendered
+
+        :return: recordset of `ir.attachment`
+        :rtype: :py:class:`openerp.models.Model`
+        """
+        self.ensure_one()
+        return self.env['ir.attachment'].search([
+            ('res_model', '=', self._name),
+            ('res_id', '=', self.id),
+            ('name', '=like', 'ISR chunk %'),
+        ], order='name')
+
+    @api.multi
+    def _get_chunks(self):
+        """Split the invoices of the job in chunks, in a stable order
+
+        :return: list of `account.invoice` recordsets
+        :rtype: list
+        """
+        self.ensure_one()
+        size = max(self.chunk_size, 1)
+        invoices = self.invoice_ids.sorted('id')
+        return [invoices[i:i + size] for i in range(0, len(invoices), size)]
+
+    @api.model
+    def _chunk_attachment_name(self, index):
+        return 'ISR chunk %05d.pdf' % index
+
+    @api.multi
+    def _render_chunk(self, index, invoices):
+        """Render a chunk of invoices and store it as an attachment"""
+        self.ensure_one()
+        report = self.env['ir.actions.report'].sudo(
+            self.user_id
+        )._get_report_from_name(REPORT_NAME)
+        pdf = report._generate_one_slip_per_page_from_invoice_pdf(
+            invoices.ids)
+        self.env['ir.attachment'].create({
+            'name': self._chunk_attachment_name(index),
+            'datas': base64.b64encode(pdf),
+            'datas_fname': self._chunk_attachment_name(index),
+            'res_model': self._name,
+            'res_id': self.id,
+            'mimetype': 'application/pdf',
+        })
+
+    @api.multi
+    def _merge_chunks(self):
+        """Merge the rendered chunks in the final attachment"""
+        self.ensure_one()
+        chunks = self._get_chunk_attachments()
+        pdfs = [base64.b64decode(chunk.datas) for chunk in chunks]
+        if len(pdfs) == 1:
+            pdf = pdfs[0]
+        else:
+            pdf = self.env['l10n_ch.payment_slip'].sudo(
+                self.user_id
+            )._merge_pdfs([io.BytesIO(pdf) for pdf in pdfs])
+        filename = '%s.pdf' % self.name
+        self.attachment_id = self.env['ir.attachment'].create({
+            'name': filename,
+            'datas': base64.b64encode(pdf),
+            'datas_fname': filename,
+            'res_model': self._name,
+            'res_id': self.id,
+            'mimetype': 'application/pdf',
+        })
+        chunks.unlink()
+
+    @api.multi
+    def _process(self):
+        """Render the missing chunks of the job, committing each of them"""
+        self.ensure_one()
+        done_names = set(self._get_chunk_attachments().mapped('name'))
+        for index, invoices in enumerate(self._get_chunks()):
+            if self._chunk_attachment_name(index) in done_names:
+                continue
+            self._render_chunk(index, invoices)
+            # keep the rendered chunk even if the job is interrupted
+            self.env.cr.commit()  # pylint: disable=invalid-commit
+            _logger.info('Payment slips job %s: chunk %d rendered',
+                         self.name, index)
+        self._merge_chunks()
+        self.state = 'done'
+
+    @api.model
+    def _cron_process_jobs(self):
+        """Process the pending jobs"""
+        for job in self.search([('state', '=', 'pending')], order='id'):
+            try:
+                job._process()
+            except Exception as err:
+                _logger.exception('Payment slips job %s failed', job.name)
+                self.env.cr.rollback()
+                job.write({
+                    'state': 'failed',
+                    'error_message': str(err),
+                })
+            self.env.cr.commit()  # pylint: disable=invalid-commit
+        return True
+
+    @api.multi
+    def action_retry(self):
+        """Put failed jobs back in the queue, rendered chunks are kept"""
+        self.filtered(lambda job: job.state == 'failed').write({
+            'state': 'pending',
+            'error_message': False,
+        })
+        return True
+
+    @api.model
+    def create_from_invoices(self, invoices):
+        """Create a job printing the payment slips of the invoices
+
+        :param invoices: recordset of `account.invoice`
+        :type invoices: :py:class:`openerp.models.Model`
+
+        :return: recordset of `isr.batch.print.job`
+        :rtype: :py:class:`openerp.models.Model`
+        """
+        invoices._check_isr_generatable()
+        invoices.write({'sent': True})
+        return self.create({
+            'name': _('Payment slips %s') % fields.Datetime.now(),
+            'invoice_ids': [(6, 0, invoices.ids)],
+        })
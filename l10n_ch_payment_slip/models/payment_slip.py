@@ -4,22 +4,46 @@
 import base64
 import io
 import contextlib
+import logging
+import multiprocessing
+import os
 import re
+import signal
+import tempfile
 import textwrap
-from collections import namedtuple
+import threading
+import warnings
+from collections import namedtuple, OrderedDict
 from reportlab.pdfgen.canvas import Canvas
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.lib.units import inch
 from odoo import models, fields, api, _, exceptions, tools
 from odoo.modules import get_module_resource
-from odoo.tools.misc import mod10r, format_date
+from odoo.service import server as odoo_server
+from odoo.tools import config
+from odoo.tools.misc import format_date
+
+from odoo.addons.l10n_ch_base_bank.tools.checksum import mod10r
+from ..tools import isr_reference
+from .slip_render_cache import SlipRenderCache, render_cache_key
+
+_logger = logging.getLogger(__name__)
+
+try:
+    import PyPDF2
+except (ImportError, IOError) as err:
+    _logger.debug(err)
 
 FontMeta = namedtuple('FontMeta', ('name', 'size'))
+SlipAddress = namedtuple('SlipAddress', ('name', 'address_lines'))
+SlipBank = namedtuple('SlipBank', ('name', 'zip', 'city'))
 
 
 ADDR_FORMAT = "%(street)s\n%(street2)s\n%(zip)s %(city)s"
 PARTNER_NUM_SIZE = 7
+# default maximum size of the render cache in MB, disabled by default
+RENDER_CACHE_SIZE = 0
 
 
 class PaymentSlipSettings(object):
@@ -36,6 +60,57 @@ class PaymentSlipSettings(object):
         pass
 
 
+class PaymentSlipData(object):
+    """Slip content container
+
+    Holds plain values only, so it can be drawn without any database
+    access and sent to rendering processes.
+    """
+
+    def __init__(self, **kwargs):
+        for param, value in kwargs.items():
+            setattr(self, param, value)
+
+
+# Fonts registered in reportlab by this process, font name: font path
+_registered_fonts = {}
+_registered_fonts_lock = threading.Lock()
+
+# Payment slip model used by the rendering processes, set when they start
+_render_worker_model = None
+
+
+def _init_render_worker(slip_model):
+    """Rendering process initializer
+
+    Signal handlers inherited from the Odoo worker are reset so the pool
+    is able to stop its processes.
+    """
+    global _render_worker_model
+    for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP):
+        signal.signal(signum, signal.SIG_DFL)
+    _render_worker_model = slip_model
+
+
+def _render_slips_chunk(args):
+    """Render a chunk of slips in a rendering process
+
+    The chunk is written in a temporary file, removed by the caller.
+
+    :return: path of the rendered chunk
+    """
+    slips_data, print_settings, a4 = args
+    fd, path = tempfile.mkstemp(suffix='.pdf', prefix='isr_chunk.')
+    try:
+        with os.fdopen(fd, 'wb') as output:
+            _render_worker_model._render_slips(slips_data, print_settings,
+                                               a4=a4, output=output)
+    except Exception:
+        os.unlink(path)
+        raise
+    return path
+
+
 class PaymentSlip(models.Model):
     """From Version 8 payment slip are now a
     new Model related to move line and
@@ -53,6 +128,8 @@ class PaymentSlip(models.Model):
     _default_scan_font_size = 11
     _default_amount_font_size = 16
     _compile_get_ref = re.compile(r'\D')
+    # number of slips rendered by a process when rendering in parallel
+    _render_chunk_size = 500
 
     _name = 'l10n_ch.payment_slip'
     _description = 'Payment Slip'
@@ -183,28 +260,48 @@ class PaymentSlip(models.Model):
         (4) Control digit (size: 1)
         """
         # pylint: enable=anomalous-backslash-in-string
-        for rec in self:
-            move_line = rec.move_line_id
-            if not rec._can_generate(move_line):
-                continue
-            # We should not use technical id but will keep it for
-            # historical reason
-            move_number = str(move_line.id)
-            id_number = rec._get_isrb_id_number()
-            partner_number = rec._get_partner_number()
-            if move_line.invoice_id.number:
-                compound = move_line.invoice_id.number + str(move_line.id)
-                move_number = rec._compile_get_ref.sub('', compound)
-            # take only last digits of move if it exceed boundaries
-            extra = len(move_number) + len(id_number) + PARTNER_NUM_SIZE - 26
-            if extra > 0:
-                move_number = move_number[extra:]
-            move_number = move_number.rjust(
-                26 - len(id_number) - PARTNER_NUM_SIZE, '0'
-            )
-            reference = mod10r(id_number + partner_number + move_number)
+        for rec, row in self._get_isr_rows():
+            reference = isr_reference.compute_reference(row, checksum=mod10r)
             rec.reference = rec._space(reference)
 
+    @api.multi
+    def _get_isr_row(self):
+        """Return the values needed to compute the reference and the scan
+        line of the slip, read with the hooks `_get_isrb_id_number` and
+        `_get_partner_number`
+
+        :rtype: :py:class:`IsrRow`
+        """
+        self.ensure_one()
+        move_line = self.move_line_id
+        invoice = move_line.invoice_id
+        # We should not use technical id but will keep it for
+        # historical reason
+        return isr_reference.IsrRow(
+            id_number=self._get_isrb_id_number(),
+            partner_number=self._get_partner_number(),
+            invoice_number=invoice.number,
+            line_id=move_line.id,
+            amount=self.amount_total,
+            subscription=invoice.l10n_ch_isr_subscription or '',
+        )
+
+    @api.multi
+    def _get_isr_rows(self):
+        """Read the values needed to compute references and scan lines
+
+        Relations of all the slips are read at once. Slips for which no
+        payment slip should be generated are left out.
+
+        :return: pairs of slip record and its values
+        :rtype: list of tuple(record, :py:class:`IsrRow`)
+        """
+        invoices = self.mapped('move_line_id.invoice_id')
+        invoices.mapped('partner_id.ref')
+        invoices.mapped('partner_bank_id.l10n_ch_isrb_id_number')
+        return [(rec, rec._get_isr_row()) for rec in self
+                if rec._can_generate(rec.move_line_id)]
+
     @api.model
     def _space(self, nbr, nbrspc=5):
         """Spaces ref by group of 5 digits.
@@ -223,7 +320,7 @@ class PaymentSlip(models.Model):
         :rtype: str
 
         """
-        return ''.join([' '[(i - 2) % nbrspc:] + c for i, c in enumerate(nbr)])
+        return isr_reference.space_reference(nbr, nbrspc)
 
     def _compute_scan_line_list(self):
         """Generate a list containing all element of scan line
@@ -238,20 +335,10 @@ class PaymentSlip(models.Model):
         :rtype: list
         """
         self.ensure_one()
-        line = []
         if not self._can_generate(self.move_line_id):
             return []
-        justified_amount = '01%s' % ('%.2f' % self.amount_total).replace(
-            '.', '').rjust(10, '0')
-        line.extend(mod10r(justified_amount))
-        line.append('>')
-        line.extend(self.reference.replace(" ", ""))
-        line.append('+')
-        line.append(' ')
-        invoice = self.move_line_id.invoice_id
-        line.extend(invoice.l10n_ch_isr_subscription)
-        line.append('>')
-        return line
+        return list(isr_reference.compute_scan_line(
+            self._get_isr_row(), self.reference, checksum=mod10r))
 
     @api.depends('amount_total',
                  'reference',
@@ -298,20 +385,40 @@ class PaymentSlip(models.Model):
         :rtype: str
         """
         # pylint: enable=anomalous-backslash-in-string
+        # read the relations of all the slips at once
+        self.mapped('move_line_id.invoice_id.partner_bank_id')
         for rec in self:
             scan_line_list = rec._compute_scan_line_list()
             rec.scan_line = ''.join(scan_line_list)
 
+    @api.model
+    def _prepare_slip_vals(self, move_line):
+        """Compute payment slip values to be used by `models.Model.create`
+
+        :param move_line: Record of `account.move.line`
+        :type move_line: :py:class:`openerp.models.Model`
+
+        :return: values
+        :rtype: dict
+        """
+        return {'move_line_id': move_line.id}
+
     @api.model
     def get_slip_for_move_line(self, move_line):
         """Return pyment slip related to move
 
+        Deprecated, use :py:meth:`_compute_pay_slips_from_move_lines`,
+        which works on many move lines.
+
         :param move: `account.move.line` record
         :type move: :py:class:`openerp.models.Model`
 
         :return: payment slip recordset related to move line
         :rtype: :py:class:`openerp.models.Model`
         """
+        warnings.warn('get_slip_for_move_line is deprecated, use '
+                      '_compute_pay_slips_from_move_lines',
+                      DeprecationWarning, stacklevel=2)
         return self.search(
             [('move_line_id', '=', move_line.id)]
         )
@@ -321,19 +428,31 @@ class PaymentSlip(models.Model):
         """Generate `l10n_ch.payment_slip` from
         `account.move.line` recordset
 
+        Deprecated, use :py:meth:`_compute_pay_slips_from_move_lines`,
+        which works on many move lines, and override
+        :py:meth:`_prepare_slip_vals` to change the values of the slips.
+
         :param move_lines: Record of `account.move.line`
         :type move_line: :py:class:`openerp.models.Model`
 
         :return: Recordset of `l10n_ch.payment_slip`
         :rtype: :py:class:`openerp.models.Model`
         """
-        return self.create({'move_line_id': move_line.id})
+        warnings.warn('create_slip_from_move_line is deprecated, use '
+                      '_compute_pay_slips_from_move_lines',
+                      DeprecationWarning, stacklevel=2)
+        return self._compute_pay_slips_from_move_lines(move_line)
 
     @api.model
     def _compute_pay_slips_from_move_lines(self, move_lines):
         """Get or generate `l10n_ch.payment_slip` from
         `account.move.line` recordset
 
+        Existing slips of all the move lines are read with one search
+        and the missing ones are created at once, so their references
+        are computed together. Values of the created slips are given by
+        :py:meth:`_prepare_slip_vals`.
+
         :param move_lines: Recordset of `account.move.line`
         :type move_lines: :py:class:`openerp.models.Model`
 
@@ -341,15 +460,24 @@ class PaymentSlip(models.Model):
         :rtype: :py:class:`openerp.models.Model`
 
         """
+        move_lines = move_lines.filtered(self._can_generate)
+        if not move_lines:
+            return self.browse()
+        slips_by_line = {}
+        for slip in self.search([('move_line_id', 'in', move_lines.ids)]):
+            line_id = slip.move_line_id.id
+            slips_by_line[line_id] = slips_by_line.get(
+                line_id, self.browse()) + slip
+        missing_lines = move_lines.filtered(
+            lambda line: line.id not in slips_by_line)
+        if missing_lines:
+            new_slips = self.create(
+                [self._prepare_slip_vals(line) for line in missing_lines])
+            for slip in new_slips:
+                slips_by_line[slip.move_line_id.id] = slip
         pay_slips = self.browse()
         for move in move_lines:
-            if not self._can_generate(move):
-                continue
-            slip = self.get_slip_for_move_line(move)
-            if not slip:
-                slip = self.create_slip_from_move_line(move)
-            if slip:
-                pay_slips += slip
+            pay_slips += slips_by_line.get(move.id, self.browse())
         return pay_slips
 
     @api.model
@@ -361,9 +489,7 @@ class PaymentSlip(models.Model):
         :type move_lines: :py:class:`openerp.models.Model`
 
         """
-        move_lines = self.env['account.move.line'].browse()
-        for invoice in invoices:
-            move_lines += invoice.get_payment_move_line()
+        move_lines = invoices._get_payment_move_lines()
         return self._compute_pay_slips_from_move_lines(move_lines)
 
     def get_comm_partner(self):
@@ -423,16 +549,36 @@ class PaymentSlip(models.Model):
                                    file_name)
         return path
 
+    @api.model
+    def _register_font(self, font_identifier, path):
+        """Register a TrueType font in reportlab
+
+        The font file is parsed only once per process, following calls
+        with the same name and path do nothing.
+
+        :param font_identifier: name of the font used when drawing
+        :type font_identifier: str
+
+        :param path: path to the TrueType font file
+        :type path: str
+        """
+        with _registered_fonts_lock:
+            if _registered_fonts.get(font_identifier) == path:
+                return
+            pdfmetrics.registerFont(TTFont(font_identifier, path))
+            _registered_fonts[font_identifier] = path
+
     @api.model
     def _register_fonts(self):
         """Hook to register any font that can be
         needed in payment slip
 
+        Use :py:meth:`_register_font` so fonts are loaded only once
+
         see `pdfmetrics.registerFont` doc for more details
         """
         font_identifier = 'ocrb_font'
-        pdfmetrics.registerFont(TTFont(font_identifier,
-                                       self.font_absolute_path()))
+        self._register_font(font_identifier, self.font_absolute_path())
 
     @api.model
     def _get_small_text_font(self):
@@ -555,11 +701,14 @@ class PaymentSlip(models.Model):
         :param font: font to use
         :type font: :py:class:`FontMeta`
 
-        :param com_partner: commercial partner record for model `res.partner`
-        :type com_partner: :py:class:`openerp.models.Model`
+        :param com_partner: address to draw, a commercial partner record
+                            for model `res.partner` is also accepted
+        :type com_partner: :py:class:`SlipAddress`
 
         """
-        address_lines = self._get_address_lines(com_partner.id)
+        if isinstance(com_partner, models.BaseModel):
+            com_partner = self._get_slip_address(com_partner)
+        address_lines = com_partner.address_lines
 
         font_size, cutoff_length = self._get_address_font_size(
             font.size, address_lines, com_partner)
@@ -578,9 +727,36 @@ class PaymentSlip(models.Model):
 
         canvas.drawText(text)
 
+    def _get_slip_address(self, partner):
+        """Collect the address of a partner as drawn on the slip
+
+        :param partner: record for model `res.partner`
+        :type partner: :py:class:`openerp.models.Model`
+
+        :return: name and address lines of the partner
+        :rtype: :py:class:`SlipAddress`
+        """
+        return SlipAddress(name=partner.name,
+                           address_lines=self._get_address_lines(partner.id))
+
+    @api.multi
+    def _get_description_line(self):
+        """Return the line shown above the payment slip
+
+        :return: text with the invoice number and payment term
+        :rtype: str
+        """
+        self.ensure_one()
+        invoice = self.move_line_id.invoice_id
+        date_maturity = self.move_line_id.date_maturity
+        message = _('Payment slip related to invoice %s '
+                    'due on the %s')
+        fmt_date = format_date(self.env, date_maturity)
+        return message % (invoice.number, fmt_date)
+
     @api.multi
     def _draw_description_line(self, canvas, print_settings, initial_position,
-                               font):
+                               font, description=None):
         """ Draw a line above the payment slip
 
         The line shows the invoice number and payment term.
@@ -597,18 +773,17 @@ class PaymentSlip(models.Model):
         :param font: font to use
         :type font: :py:class:`FontMeta`
 
+        :param description: text to draw, computed from the slip if not given
+        :type description: str
+
         """
+        if description is None:
+            description = self._get_description_line()
         x, y = initial_position
         # align with the address
         x += print_settings.isr_add_horz * inch
-        invoice = self.move_line_id.invoice_id
-        date_maturity = self.move_line_id.date_maturity
-        message = _('Payment slip related to invoice %s '
-                    'due on the %s')
-        fmt_date = format_date(self.env, date_maturity)
         canvas.setFont(font.name, font.size)
-        canvas.drawString(x, y,
-                          message % (invoice.number, fmt_date))
+        canvas.drawString(x, y, description)
 
     @api.model
     def _draw_bank(self, canvas, print_settings, initial_position, font, bank):
@@ -626,8 +801,8 @@ class PaymentSlip(models.Model):
         :param font: font to use
         :type font: :py:class:`FontMeta`
 
-        :param bank: bank record
-        :type bank: :py:class:`openerp.model.Models`
+        :param bank: bank name, zip and city
+        :type bank: :py:class:`SlipBank`
 
         """
         x, y = initial_position
@@ -770,7 +945,8 @@ class PaymentSlip(models.Model):
             indice += 1
 
     @api.model
-    def _draw_scan_line(self, canvas, print_settings, initial_position, font):
+    def _draw_scan_line(self, canvas, print_settings, initial_position, font,
+                        scan_line=None):
         """Draw reference on canvas
 
 
@@ -786,12 +962,18 @@ class PaymentSlip(models.Model):
         :param font: font to use
         :type font: :py:class:`FontMeta`
 
+        :param scan_line: scan line elements, computed from the slip
+                          if not given
+        :type scan_line: list
+
         """
+        if scan_line is None:
+            scan_line = self._compute_scan_line_list()
         x, y = initial_position
         x += print_settings.isr_scan_line_horz * inch
         y += print_settings.isr_scan_line_vert * inch
         canvas.setFont(font.name, font.size)
-        for car in self._compute_scan_line_list()[::-1]:
+        for car in scan_line[::-1]:
             canvas.drawString(x, y, car)
             # some font type return non numerical
             x -= 0.1 * inch
@@ -848,127 +1030,566 @@ class PaymentSlip(models.Model):
                 'Only PDF payment slip are supported'
             )
         self.ensure_one()
-        lang = self.invoice_id.partner_id.lang
-        self = self.with_context(lang=lang)
-        company = self.env.user.company_id
         print_settings = self._get_settings(report_name)
-        self._register_fonts()
-        default_font = self._get_text_font()
-        small_font = self._get_small_text_font()
-        amount_font = self._get_amount_font()
+        slip_data = self._get_slips_data(a4=a4)[0]
+        img_stream = self._render_slip_cached(slip_data, print_settings,
+                                              a4=a4)
+        if b64:
+            img_stream = base64.encodestring(img_stream)
+        return img_stream
+
+    @api.model
+    def _render_slip_cached(self, slip_data, print_settings, a4=False):
+        """Draw a single slip, or read it from the render cache
+
+        :param slip_data: values of the slip
+        :type slip_data: :py:class:`PaymentSlipData`
+
+        :param print_settings: layouts print setting
+        :type print_settings: :py:class:`PaymentSlipSettings` or subclass
+
+        :return: PDF document
+        :rtype: bytes
+        """
+        cache = self._get_render_cache()
+        img_stream = None
+        if cache:
+            key = self._get_render_cache_key(slip_data, print_settings, a4)
+            img_stream = cache.get(key)
+        if img_stream is None:
+            img_stream = self._render_slips([slip_data], print_settings,
+                                            a4=a4)
+            if cache:
+                cache.set(key, img_stream)
+        return img_stream
+
+    @api.model
+    def _get_render_cache(self):
+        """Return the cache of rendered slips of the database
+
+        Its maximum size in MB is set by the system parameter
+        `isr.render.cache.size`, 0 disables the cache.
+
+        :return: the render cache or None if disabled
+        :rtype: :py:class:`SlipRenderCache`
+        """
+        config_param = self.env['ir.config_parameter'].sudo()
+        size = config_param.get_param('isr.render.cache.size',
+                                      RENDER_CACHE_SIZE)
+        try:
+            size = int(size)
+        except ValueError:
+            size = 0
+        if size <= 0:
+            return None
+        path = os.path.join(config.filestore(self.env.cr.dbname),
+                            'l10n_ch_payment_slip_render')
+        return SlipRenderCache(path, size * 1024 * 1024)
+
+    @api.model
+    @tools.ormcache()
+    def _get_module_versions(self):
+        """Return the versions of this module and of the installed modules
+        depending on it, which may override the drawing
+
+        :return: sorted (name, version) pairs
+        :rtype: tuple
+        """
+        module = self.env['ir.module.module'].sudo().search(
+            [('name', '=', 'l10n_ch_payment_slip')], limit=1)
+        modules = module | module.downstream_dependencies()
+        return tuple(sorted(
+            (mod.name, mod.latest_version) for mod in modules
+        ))
+
+    @api.model
+    def _get_render_cache_key(self, slip_data, print_settings, a4):
+        """Return the key of a rendered slip
+
+        Every input of the rendering is part of the key so a slip is
+        rendered again as soon as one of them changes. Versions of the
+        modules depending on this one are included, as they may change
+        the drawing without changing the inputs.
+
+        :return: hexadecimal hash
+        :rtype: str
+        """
+        return render_cache_key(
+            self._get_module_versions(),
+            a4,
+            sorted(vars(slip_data).items()),
+            sorted(vars(print_settings).items()),
+        )
+
+    @api.multi
+    def _prepare_slip_data(self, a4=False, addresses=None):
+        """Collect everything drawn on the payment slip
+
+        :param a4: If set to True the description line is also collected
+        :type a4: bool
+
+        :param addresses: addresses already collected by partner id, shared
+                          by the slips of a same language
+        :type addresses: dict
+
+        :return: values of the slip
+        :rtype: :py:class:`PaymentSlipData`
+        """
+        self.ensure_one()
+        if addresses is None:
+            addresses = {}
+        company_partner = self.env.user.company_id.partner_id
+        com_partner = self.get_comm_partner()
+        for partner in (company_partner, com_partner):
+            if partner.id not in addresses:
+                addresses[partner.id] = self._get_slip_address(partner)
         invoice = self.move_line_id.invoice_id
-        scan_font = self._get_scan_line_text_font(company)
-        isr_subs_number = invoice.l10n_ch_isr_subscription_formatted
         bank_acc = invoice.partner_bank_id
+        bank = bank_acc.bank_id
+        return PaymentSlipData(
+            id=self.id,
+            lang=self.env.context.get('lang'),
+            reference=self.reference,
+            amount_total=self.amount_total,
+            scan_line=self._compute_scan_line_list(),
+            description=a4 and self._get_description_line(),
+            print_partner=bank_acc.print_partner,
+            print_account=bank_acc.print_account,
+            print_bank=bank_acc.print_bank,
+            has_subscription=bool(invoice.l10n_ch_isr_subscription),
+            isr_subs_number=invoice.l10n_ch_isr_subscription_formatted,
+            company_address=addresses[company_partner.id],
+            partner_address=addresses[com_partner.id],
+            bank=SlipBank(name=bank.name or '', zip=bank.zip, city=bank.city),
+        )
+
+    @api.multi
+    def _get_slips_data(self, a4=False):
+        """Collect the values of every slip, in the language of the customer
+
+        The relations of all the slips are read at once and the addresses
+        are collected once per partner and language, so the number of
+        queries does not grow with the number of slips.
+
+        :return: list of :py:class:`PaymentSlipData`
+        :rtype: list
+        """
+        move_lines = self.mapped('move_line_id')
+        move_lines.mapped('debit')
+        invoices = move_lines.mapped('invoice_id')
+        invoices.mapped('partner_id.lang')
+        invoices.mapped('commercial_partner_id.name')
+        invoices.mapped('partner_bank_id.bank_id.name')
+        slip_ids_by_lang = OrderedDict()
+        for slip in self:
+            lang = slip.invoice_id.partner_id.lang
+            slip_ids_by_lang.setdefault(lang, []).append(slip.id)
+        slips_data = {}
+        for lang, slip_ids in slip_ids_by_lang.items():
+            addresses = {}
+            for slip in self.browse(slip_ids).with_context(lang=lang):
+                slips_data[slip.id] = slip._prepare_slip_data(
+                    a4=a4, addresses=addresses)
+        return [slips_data[slip_id] for slip_id in self.ids]
+
+    @api.multi
+    def _draw_payment_slips(self, a4=False, out_format='PDF', b64=False,
+                            report_name=None, output=None):
+        """Generate one document containing all the payment slips
+
+        Every slip of the recordset is drawn on its own page of a single
+        canvas, so only one PDF document is built and no merge is needed.
+
+        When the company sets more than one rendering process and the
+        server runs in prefork mode, large batches are split in chunks
+        rendered in parallel and merged.
+
+        Only a document of a single slip goes through the render cache.
+
+        :param a4: If set to True will print on slip on a A4 paper format
+        :type a4: bool
+
+        :param out_format: output format at current time only PDF is supported
+        :type out_format: str
+
+        :param b64: If set to True the output image string
+                    will be encoded to base64
+
+        :param output: binary file object the document is written to,
+                       instead of being returned
+        :type output: file object
+
+        :return: slips image string, or the output when given
+        :rtype: str
+        """
+        if out_format != 'PDF':
+            raise NotImplementedError(
+                'Only PDF payment slip are supported'
+            )
+        if b64 and output is not None:
+            raise ValueError('b64 cannot be used with an output file')
+        print_settings = self._get_settings(report_name)
+        slips_data = self._get_slips_data(a4=a4)
+        workers = self.env.user.company_id.slip_render_workers
+        if len(slips_data) == 1:
+            # a document of several slips is not cached, its key would
+            # hardly be met again
+            img_stream = self._render_slip_cached(slips_data[0],
+                                                  print_settings, a4=a4)
+            if output is not None:
+                output.write(img_stream)
+                img_stream = output
+        elif (workers > 1 and len(slips_data) > self._render_chunk_size and
+                self._can_render_in_parallel()):
+            img_stream = self._render_slips_parallel(
+                slips_data, print_settings, workers, a4=a4, output=output)
+        else:
+            img_stream = self._render_slips(slips_data, print_settings,
+                                            a4=a4, output=output)
+        if b64:
+            img_stream = base64.encodestring(img_stream)
+        return img_stream
+
+    @api.model
+    def _render_slips(self, slips_data, print_settings, a4=False,
+                      output=None):
+        """Draw slips, one per page, into a PDF document
+
+        No database access is done here, so it can run in a rendering
+        process.
+
+        :param slips_data: list of :py:class:`PaymentSlipData`
+        :type slips_data: list
+
+        :param print_settings: layouts print setting
+        :type print_settings: :py:class:`PaymentSlipSettings` or subclass
+
+        :param output: binary file object the document is written to,
+                       instead of being returned
+        :type output: file object
+
+        :return: PDF document, or the output when given
+        :rtype: bytes
+        """
+        if output is None:
+            with contextlib.closing(io.BytesIO()) as buff:
+                self._render_slips(slips_data, print_settings, a4=a4,
+                                   output=buff)
+                return buff.getvalue()
+        self._register_fonts()
         if a4:
             canvas_size = (595.27, 841.89)
         else:
             canvas_size = (595.27, 286.81)
-        with contextlib.closing(io.BytesIO()) as buff:
-            canvas = Canvas(buff,
-                            pagesize=canvas_size,
-                            pageCompression=None)
-            self._draw_background(canvas, print_settings)
-            canvas.setFillColorRGB(*self._fill_color)
-            if a4:
-                initial_position = (0.05 * inch, 4.50 * inch)
-                self._draw_description_line(canvas,
-                                            print_settings,
-                                            initial_position,
-                                            default_font)
-            if invoice.partner_bank_id.print_partner:
-                if (invoice.partner_bank_id.print_account or
-                        invoice.l10n_ch_isr_subscription):
-                    initial_position = (0.05 * inch, 3.30 * inch)
-                else:
-                    initial_position = (0.05 * inch, 3.75 * inch)
-                self._draw_address(canvas, print_settings, initial_position,
-                                   default_font, company.partner_id)
-                if (invoice.partner_bank_id.print_account or
-                        invoice.l10n_ch_isr_subscription):
-                    initial_position = (2.45 * inch, 3.30 * inch)
-                else:
-                    initial_position = (2.45 * inch, 3.75 * inch)
-                self._draw_address(canvas, print_settings, initial_position,
-                                   default_font, company.partner_id)
-            com_partner = self.get_comm_partner()
-            initial_position = (0.05 * inch, 1.4 * inch)
+        canvas = Canvas(output,
+                        pagesize=canvas_size,
+                        pageCompression=None)
+        # static parts shared by slips are drawn once per document
+        forms = {}
+        # slips are drawn in the language of the customer
+        models_by_lang = {}
+        for slip_data in slips_data:
+            if slip_data.lang not in models_by_lang:
+                models_by_lang[slip_data.lang] = self.with_context(
+                    lang=slip_data.lang)
+            slip = models_by_lang[slip_data.lang].browse(slip_data.id)
+            slip._draw_payment_slip_page(
+                canvas, print_settings, slip_data, a4=a4, forms=forms)
+            canvas.showPage()
+        canvas.save()
+        return output
+
+    @api.model
+    def _can_render_in_parallel(self):
+        """Tell if rendering processes can be forked from this process
+
+        Forking a multi-threaded server is not safe: a lock held by another
+        thread, e.g. by logging, stays locked forever in the child. Slips
+        are only rendered in parallel by the workers of the prefork server
+        (`--workers` above 0). A worker serves its requests from a thread
+        of its own, its main thread only waits for that one, so no lock is
+        held by another thread when forking.
+
+        :rtype: bool
+        """
+        server = odoo_server.server
+        if not isinstance(server, odoo_server.PreforkServer) or \
+                server.pid == os.getpid():
+            _logger.debug('Payment slips are rendered in the current '
+                          'process, as it is not a prefork worker')
+            return False
+        return True
+
+    @api.model
+    def _render_slips_parallel(self, slips_data, print_settings, workers,
+                               a4=False, output=None):
+        """Draw slips in a pool of processes and merge the chunks in order
+
+        Processes are forked from the current one, so overrides of the
+        drawing methods must not access the database, and the current
+        process must be single threaded, see
+        :py:meth:`_can_render_in_parallel`.
+
+        Chunks are written by the processes in temporary files, which are
+        merged then removed.
+
+        :param slips_data: list of :py:class:`PaymentSlipData`
+        :type slips_data: list
+
+        :param workers: number of rendering processes
+        :type workers: int
+
+        :param output: binary file object the document is written to,
+                       instead of being returned
+        :type output: file object
+
+        :return: PDF document, or the output when given
+        :rtype: bytes
+        """
+        size = self._render_chunk_size
+        chunks = [(slips_data[i:i + size], print_settings, a4)
+                  for i in range(0, len(slips_data), size)]
+        _logger.info('Rendering %d payment slips in %d chunks with %d '
+                     'processes', len(slips_data), len(chunks), workers)
+        # fonts are registered once for all the forked processes
+        self._register_fonts()
+        context = multiprocessing.get_context('fork')
+        pool = context.Pool(processes=min(workers, len(chunks)),
+                            initializer=_init_render_worker,
+                            initargs=(self.browse(),))
+        paths = []
+        try:
+            try:
+                for path in pool.imap(_render_slips_chunk, chunks,
+                                      chunksize=1):
+                    paths.append(path)
+                pool.close()
+            except Exception:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+            return self._merge_pdfs(paths, output=output)
+        finally:
+            for path in paths:
+                os.unlink(path)
+
+    @api.model
+    def _merge_pdfs(self, docs, output=None):
+        """Merge PDF documents
+
+        Without output, the document is returned, merged following the
+        company merge mode.
+
+        :param docs: paths or binary file objects of the PDF documents
+        :type docs: list
+
+        :param output: binary file object the document is written to
+        :type output: file object
+
+        :return: merged PDF document, or the output when given
+        :rtype: bytes
+        """
+        if output is not None:
+            merger = PyPDF2.PdfFileMerger()
+            try:
+                for doc in docs:
+                    merger.append(doc, import_bookmarks=False)
+                merger.write(output)
+            finally:
+                merger.close()
+            return output
+        report_model = self.env['ir.actions.report']
+        if self.env.user.company_id.merge_mode == 'in_memory':
+            return report_model.merge_pdf_in_memory(docs)
+        path = report_model.merge_pdf_on_disk(docs)
+        try:
+            with open(path, 'rb') as pdfdocument:
+                return pdfdocument.read()
+        finally:
+            os.unlink(path)
+
+    @api.model
+    def _get_static_form_key(self, slip_data):
+        """Return the key identifying the static parts of a slip
+
+        Slips having the same key share the same form in a document.
+        Forms only live in the canvas which defines them: reportlab cannot
+        reuse a page rendered in another document, so the static parts
+        are drawn once per document and key, not once per process.
+
+        :param slip_data: values of the slip
+        :type slip_data: :py:class:`PaymentSlipData`
+
+        :return: hashable key
+        :rtype: tuple
+        """
+        company_address = slip_data.company_address
+        return (
+            slip_data.print_partner,
+            slip_data.print_account,
+            slip_data.print_bank,
+            slip_data.has_subscription,
+            slip_data.isr_subs_number,
+            company_address.name,
+            tuple(company_address.address_lines),
+            slip_data.bank,
+        )
+
+    @api.model
+    def _draw_payment_slip_static(self, canvas, print_settings, slip_data):
+        """Draw the parts of a slip which only depend on the creditor
+
+        Background, company address, bank and subscription number are the
+        same for every slip of a bank account.
+
+        :param canvas: payment slip reportlab component to be drawn
+        :type canvas: :py:class:`reportlab.pdfgen.canvas.Canvas`
+
+        :param print_settings: layouts print setting
+        :type print_settings: :py:class:`PaymentSlipSettings` or subclass
+
+        :param slip_data: values of the slip
+        :type slip_data: :py:class:`PaymentSlipData`
+        """
+        default_font = self._get_text_font()
+        self._draw_background(canvas, print_settings)
+        canvas.setFillColorRGB(*self._fill_color)
+        if slip_data.print_partner:
+            if slip_data.print_account or slip_data.has_subscription:
+                initial_position = (0.05 * inch, 3.30 * inch)
+            else:
+                initial_position = (0.05 * inch, 3.75 * inch)
             self._draw_address(canvas, print_settings, initial_position,
-                               default_font, com_partner)
-            initial_position = (4.86 * inch, 2.2 * inch)
+                               default_font, slip_data.company_address)
+            if slip_data.print_account or slip_data.has_subscription:
+                initial_position = (2.45 * inch, 3.30 * inch)
+            else:
+                initial_position = (2.45 * inch, 3.75 * inch)
             self._draw_address(canvas, print_settings, initial_position,
-                               default_font, com_partner)
-            num_car, frac_car = ("%.2f" % self.amount_total).split('.')
-            self._draw_amount(canvas, print_settings,
-                              (1.48 * inch, 2.0 * inch),
-                              amount_font, num_car)
-            self._draw_amount(canvas, print_settings,
-                              (2.14 * inch, 2.0 * inch),
-                              amount_font, frac_car)
-            self._draw_amount(canvas, print_settings,
-                              (3.88 * inch, 2.0 * inch),
-                              amount_font, num_car)
-            self._draw_amount(canvas, print_settings,
-                              (4.50 * inch, 2.0 * inch),
-                              amount_font, frac_car)
-            if invoice.partner_bank_id.print_bank:
-                self._draw_bank(canvas,
-                                print_settings,
-                                (0.05 * inch, 3.75 * inch),
-                                default_font,
-                                bank_acc.bank_id)
-                self._draw_bank(canvas,
-                                print_settings,
-                                (2.45 * inch, 3.75 * inch),
-                                default_font,
-                                bank_acc.bank_id)
-            if invoice.partner_bank_id.print_account:
-                self._draw_bank_account(canvas,
-                                        print_settings,
-                                        (1 * inch, 2.35 * inch),
-                                        default_font,
-                                        isr_subs_number)
-                self._draw_bank_account(canvas,
+                               default_font, slip_data.company_address)
+        if slip_data.print_bank:
+            self._draw_bank(canvas,
+                            print_settings,
+                            (0.05 * inch, 3.75 * inch),
+                            default_font,
+                            slip_data.bank)
+            self._draw_bank(canvas,
+                            print_settings,
+                            (2.45 * inch, 3.75 * inch),
+                            default_font,
+                            slip_data.bank)
+        if slip_data.print_account:
+            self._draw_bank_account(canvas,
+                                    print_settings,
+                                    (1 * inch, 2.35 * inch),
+                                    default_font,
+                                    slip_data.isr_subs_number)
+            self._draw_bank_account(canvas,
+                                    print_settings,
+                                    (3.4 * inch, 2.35 * inch),
+                                    default_font,
+                                    slip_data.isr_subs_number)
+
+    def _draw_payment_slip_page(self, canvas, print_settings, slip_data,
+                                a4=False, forms=None):
+        """Draw a payment slip on the current page of a canvas
+
+        :param canvas: payment slip reportlab component to be drawn
+        :type canvas: :py:class:`reportlab.pdfgen.canvas.Canvas`
+
+        :param print_settings: layouts print setting
+        :type print_settings: :py:class:`PaymentSlipSettings` or subclass
+
+        :param slip_data: values of the slip
+        :type slip_data: :py:class:`PaymentSlipData`
+
+        :param a4: If set to True will print on slip on a A4 paper format
+        :type a4: bool
+
+        :param forms: forms already defined in the canvas by static key,
+                      when given static parts are drawn as a shared form
+        :type forms: dict
+        """
+        if forms is None:
+            self._draw_payment_slip_static(canvas, print_settings, slip_data)
+        else:
+            key = self._get_static_form_key(slip_data)
+            form_name = forms.get(key)
+            if not form_name:
+                form_name = forms[key] = 'isr_static_%d' % len(forms)
+                canvas.beginForm(form_name)
+                self._draw_payment_slip_static(canvas, print_settings,
+                                               slip_data)
+                canvas.endForm()
+            canvas.doForm(form_name)
+        default_font = self._get_text_font()
+        small_font = self._get_small_text_font()
+        amount_font = self._get_amount_font()
+        scan_font = self._get_scan_line_text_font(print_settings)
+        canvas.setFillColorRGB(*self._fill_color)
+        if a4:
+            initial_position = (0.05 * inch, 4.50 * inch)
+            self._draw_description_line(canvas,
                                         print_settings,
-                                        (3.4 * inch, 2.35 * inch),
+                                        initial_position,
                                         default_font,
-                                        isr_subs_number)
-
-            if print_settings.isr_header_partner_address:
-                self._draw_address(canvas, print_settings,
-                                   (4.9 * inch, 9.0 * inch),
-                                   default_font, com_partner)
-
-            self._draw_ref(canvas,
-                           print_settings,
-                           (4.9 * inch, 2.70 * inch),
-                           default_font,
-                           self.reference)
-            self._draw_recipe_ref(canvas,
-                                  print_settings,
-                                  (0.05 * inch, 1.6 * inch),
-                                  small_font,
-                                  self.reference)
-            self._draw_scan_line(canvas,
-                                 print_settings,
-                                 (8.26 * inch - 4 / 10 * inch, 4 / 6 * inch),
-                                 scan_font)
-            self._draw_hook(canvas, print_settings)
-            canvas.showPage()
-            canvas.save()
-            img_stream = buff.getvalue()
-            if b64:
-                img_stream = base64.encodestring(img_stream)
-            return img_stream
+                                        slip_data.description)
+        com_partner = slip_data.partner_address
+        initial_position = (0.05 * inch, 1.4 * inch)
+        self._draw_address(canvas, print_settings, initial_position,
+                           default_font, com_partner)
+        initial_position = (4.86 * inch, 2.2 * inch)
+        self._draw_address(canvas, print_settings, initial_position,
+                           default_font, com_partner)
+        num_car, frac_car = ("%.2f" % slip_data.amount_total).split('.')
+        self._draw_amount(canvas, print_settings,
+                          (1.48 * inch, 2.0 * inch),
+                          amount_font, num_car)
+        self._draw_amount(canvas, print_settings,
+                          (2.14 * inch, 2.0 * inch),
+                          amount_font, frac_car)
+        self._draw_amount(canvas, print_settings,
+                          (3.88 * inch, 2.0 * inch),
+                          amount_font, num_car)
+        self._draw_amount(canvas, print_settings,
+                          (4.50 * inch, 2.0 * inch),
+                          amount_font, frac_car)
+
+        if print_settings.isr_header_partner_address:
+            self._draw_address(canvas, print_settings,
+                               (4.9 * inch, 9.0 * inch),
+                               default_font, com_partner)
+
+        self._draw_ref(canvas,
+                       print_settings,
+                       (4.9 * inch, 2.70 * inch),
+                       default_font,
+                       slip_data.reference)
+        self._draw_recipe_ref(canvas,
+                              print_settings,
+                              (0.05 * inch, 1.6 * inch),
+                              small_font,
+                              slip_data.reference)
+        self._draw_scan_line(canvas,
+                             print_settings,
+                             (8.26 * inch - 4 / 10 * inch, 4 / 6 * inch),
+                             scan_font,
+                             slip_data.scan_line)
+        self._draw_hook(canvas, print_settings)
 
     def _compute_payment_slip_image(self):
         """Draw an us letter format slip in PNG"""
-        img = self._draw_payment_slip()
-        self.slip_image = base64.encodestring(img)
+        img = False
+        for rec in self:
+            img = rec._draw_payment_slip()
+            rec.slip_image = base64.encodestring(img)
         return img
 
     def _compute_a4_report(self):
         """Draw an a4 format slip in PDF"""
-        img = self._draw_payment_slip(a4=True, out_format='PDF')
-        self.a4_pdf = base64.encodestring(img)
+        img = False
+        for rec in self:
+            img = rec._draw_payment_slip(a4=True, out_format='PDF')
+            rec.a4_pdf = base64.encodestring(img)
         return img
@@ -52,6 +52,10 @@ class ResConfigSettings(models.TransientModel):
         related='company_id.merge_mode',
         readonly=False,
     )
+    slip_render_workers = fields.Integer(
+        related='company_id.slip_render_workers',
+        readonly=False,
+    )
     isr_background = fields.Boolean(
         related='company_id.isr_background',
         readonly=False,
@@ -0,0 +1,109 @@
+# Copyright 2019 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+
+_logger = logging.getLogger(__name__)
+
+# minimal delay in seconds between two evictions of a same cache
+EVICTION_INTERVAL = 60
+
+_last_evictions = {}
+_last_evictions_lock = threading.Lock()
+
+
+def render_cache_key(*inputs):
+    """Return the key of a rendered document from all its render inputs
+
+    Inputs must have a deterministic representation (str, numbers,
+    tuples, lists, namedtuples...).
+    """
+    return hashlib.sha1(repr(inputs).encode('utf-8')).hexdigest()
+
+
+class SlipRenderCache(object):
+    """Rendered payment slips stored on disk by key
+
+    The key being a hash of all the render inputs, a changed input gives
+    a new key and the previous document is never read again. Documents
+    read or written are touched, the least recently used ones are
+    removed when the cache exceeds its maximum size.
+    """
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+
+    def _file_path(self, key):
+        return os.path.join(self.path, key[:2], key + '.pdf')
+
+    def get(self, key):
+        """Return the cached document or None"""
+        file_path = self._file_path(key)
+        try:
+            with open(file_path, 'rb') as cached:
+                content = cached.read()
+            os.utime(file_path, None)
+        except (OSError, IOError):
+            return None
+        return content
+
+    def set(self, key, content):
+        """Store a document, failures are only logged"""
+        file_path = self._file_path(key)
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(
+                dir=os.path.dirname(file_path), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as tmp:
+                    tmp.write(content)
+                os.replace(tmp_path, file_path)
+            except Exception:
+                # not a cache entry, eviction would never remove it
+                os.unlink(tmp_path)
+                raise
+        except (OSError, IOError):
+            _logger.warning('Cannot store payment slip in render cache %s',
+                            self.path, exc_info=True)
+            return
+        self.evict()
+
+    def evict(self, force=False):
+        """Remove the least recently used documents above the maximum size
+
+        Unless forced, the cache is scanned at most once per
+        `EVICTION_INTERVAL` seconds and process.
+        """
+        now = time.time()
+        with _last_evictions_lock:
+            last = _last_evictions.get(self.path, 0)
+            if not force and now - last < EVICTION_INTERVAL:
+                return
+            _last_evictions[self.path] = now
+        entries = []
+        total_size = 0
+        for dirpath, __, filenames in os.walk(self.path):
+            for filename in filenames:
+                file_path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(file_path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, file_path))
+                total_size += stat.st_size
+        if total_size <= self.max_size:
+            return
+        entries.sort()
+        for __, size, file_path in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.unlink(file_path)
+            except OSError:
+                continue
+            total_size -= size
@@ -4,7 +4,6 @@ import os
 import tempfile
 import io
 import logging
-from contextlib import closing
 
 from odoo import models, fields, api
 
@@ -38,63 +37,46 @@ class IrActionsReportReportlab(models.Model):
                                                    'Report renderer')])
 
     @api.multi
-    def _generate_one_slip_per_page_from_invoice_pdf(self, res_ids):
+    def _generate_one_slip_per_page_from_invoice_pdf(self, res_ids,
+                                                     output=None):
         """Generate payment slip PDF(s) from report model.
 
-        If there are many pdf they are merged in memory or on
-        file system based on company settings
+        All the slips are drawn in a single pass, one per page of the
+        same document, so there is nothing left to merge.
 
-        :return: the generated PDF content
+        :param output: binary file object the document is written to,
+                       instead of being returned
+
+        :return: the generated PDF content, or the output when given
         """
-        user_model = self.env['res.users']
         slip_model = self.env['l10n_ch.payment_slip']
         invoice_model = self.env['account.invoice']
-        company = user_model.browse(self.env.uid).company_id
         invoices = invoice_model.browse(res_ids)
 
         docs = slip_model._compute_pay_slips_from_invoices(invoices)
+        return docs._draw_payment_slips(a4=True, b64=False,
+                                        out_format='PDF',
+                                        report_name=self.report_name,
+                                        output=output)
 
-        pdfdocuments = []
-        temporary_files = []
-
-        for doc in docs:
-            pdfreport_fd, pdfreport_path = tempfile.mkstemp(
-                suffix='.pdf', prefix='report.tmp.')
-            temporary_files.append(pdfreport_path)
-
-            with closing(os.fdopen(pdfreport_fd, 'wb')) as pdfreport:
-                pdf = doc._draw_payment_slip(a4=True, b64=False,
-                                             out_format='PDF',
-                                             report_name=self.report_name)
-                pdfreport.write(pdf)
+    @api.multi
+    def _render_reportlab_pdf_file(self, res_ids):
+        """Generate payment slip PDF(s) into a temporary file
 
-            pdfdocuments.append(pdfreport_path)
+        The document is drawn straight into the file, which is removed
+        from the file system once closed.
 
-        # Return the entire document
-        if len(pdfdocuments) == 1:
-            entire_report_path = pdfdocuments[0]
-        else:
-            if company.merge_mode == 'in_memory':
-                content = self.merge_pdf_in_memory(pdfdocuments)
-                entire_report_path = False
-            else:
-                entire_report_path = self.merge_pdf_on_disk(pdfdocuments)
-
-        if entire_report_path:
-            with open(entire_report_path, 'rb') as pdfdocument:
-                content = pdfdocument.read()
-            if entire_report_path not in temporary_files:
-                temporary_files.append(entire_report_path)
-
-        # Manual cleanup of the temporary files
-        for temporary_file in temporary_files:
-            try:
-                os.unlink(temporary_file)
-            except (OSError, IOError):
-                _logger.error(
-                    'Error when trying to remove file %s' % temporary_file)
-
-        return content
+        :return: file object of the generated PDF, at its beginning
+        """
+        pdfreport = tempfile.TemporaryFile(suffix='.pdf', prefix='report.tmp.')
+        try:
+            self._generate_one_slip_per_page_from_invoice_pdf(
+                res_ids, output=pdfreport)
+            pdfreport.seek(0)
+        except Exception:
+            pdfreport.close()
+            raise
+        return pdfreport
 
     @api.model
     def _get_report_from_name(self, report_name):
@@ -1,9 +1,27 @@
 # Copyright 2014-2017 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+import base64
+import io
 import time
 import re
 import logging
+import os
+import multiprocessing.dummy
+import tempfile
+import warnings
+from unittest import mock
+
+import PyPDF2
+from reportlab.pdfgen.canvas import Canvas
 from odoo.tests import common
+from odoo.addons.l10n_ch_payment_slip.models import (
+    payment_slip as payment_slip_module,
+    slip_render_cache,
+)
+from odoo.addons.l10n_ch_payment_slip.tools import isr_reference
+from odoo.addons.l10n_ch_payment_slip.models.slip_render_cache import (
+    SlipRenderCache
+)
 
 _logger = logging.getLogger(__name__)
 
@@ -47,7 +65,7 @@ class TestPaymentSlip(common.SavepointCase):
         )
         return bank_account
 
-    def make_invoice(self):
+    def make_invoice(self, validate=True):
         if not hasattr(self, 'bank_account'):
             self.bank_account = self.make_bank()
         account_model = self.env['account.account']
@@ -86,6 +104,8 @@ class TestPaymentSlip(common.SavepointCase):
             'invoice_id': invoice.id,
             'name': 'product that cost 862.50 all tax included',
         })
+        if not validate:
+            return invoice
         invoice.action_invoice_open()
         # waiting for the cache to refresh
         attempt = 0
@@ -117,6 +137,33 @@ class TestPaymentSlip(common.SavepointCase):
             else:
                 self.assertFalse(slip)
 
+    def test_pay_slips_from_invoices(self):
+        invoice1 = self.make_invoice()
+        invoice2 = self.make_invoice()
+        invoices = invoice1 | invoice2
+        slip_model = self.env['l10n_ch.payment_slip']
+        slips = invoices.mapped('slip_ids')
+        slips.unlink()
+        slips = slip_model._compute_pay_slips_from_invoices(invoices)
+        self.assertEqual(len(slips), 2)
+        self.assertEqual(slips.mapped('invoice_id'), invoices)
+        self.assertEqual(slips[0].invoice_id, invoice1)
+        self.assertTrue(all(slips.mapped('reference')))
+        # existing slips are returned, not created again
+        self.assertEqual(
+            slip_model._compute_pay_slips_from_invoices(invoices), slips)
+
+    def test_invoices_confirmation(self):
+        """Test that confirming invoices together propagate references"""
+        invoices = (self.make_invoice(validate=False) |
+                    self.make_invoice(validate=False))
+        invoices.action_invoice_open()
+        for invoice in invoices:
+            slip = invoice.slip_ids
+            self.assertEqual(len(slip), 1)
+            self.assertEqual(slip.move_line_id.transaction_ref,
+                             slip.reference.replace(' ', ''))
+
     def test_slip_validity(self):
         """Test that confirming slip are valid"""
         invoice = self.make_invoice()
@@ -136,6 +183,55 @@ class TestPaymentSlip(common.SavepointCase):
                 )
                 self.assertIn(line_ident, slip.reference.replace(' ', ''))
 
+    def test_isr_reference_engine(self):
+        rows = [
+            isr_reference.IsrRow('123456', '0000123', 'INV/2019/0042', 7,
+                                 862.5, '010001628'),
+            isr_reference.IsrRow('', '0000000', '', 7, 1.0, '010001628'),
+        ]
+        references = [isr_reference.compute_reference(row) for row in rows]
+        self.assertEqual(
+            [isr_reference.space_reference(ref) for ref in references],
+            ['12 34560 00012 30000 20190 04275',
+             '00 00000 00000 00000 00000 00079'])
+        self.assertEqual(
+            [isr_reference.compute_scan_line(row, ref)
+             for row, ref in zip(rows, references)],
+            ['0100000862503>123456000012300002019004275+ 010001628>',
+             '0100000001003>000000000000000000000000079+ 010001628>'])
+
+    def test_isr_reference_batch(self):
+        invoices = self.make_invoice() | self.make_invoice()
+        slips = self.env['l10n_ch.payment_slip'].search(
+            [('invoice_id', 'in', invoices.ids)])
+        self.assertEqual(len(slips), 2)
+        slips.invalidate_cache(['reference', 'scan_line'])
+        batch = [(slip.reference, slip.scan_line) for slip in slips]
+        for slip, values in zip(slips, batch):
+            slip.invalidate_cache(['reference', 'scan_line'])
+            self.assertEqual((slip.reference, slip.scan_line), values)
+            self.assertEqual(''.join(slip._compute_scan_line_list()),
+                             slip.scan_line)
+
+    def test_isr_reference_hooks(self):
+        invoice = self.make_invoice()
+        slip = self.env['l10n_ch.payment_slip'].search(
+            [('invoice_id', '=', invoice.id)])
+        slip_class = type(slip)
+        with mock.patch.object(slip_class, '_get_partner_number',
+                               return_value='7654321'), \
+                mock.patch.object(slip_class, '_get_isrb_id_number',
+                                  return_value='123456'), \
+                mock.patch.object(slip_class, '_space',
+                                  side_effect=lambda nbr, nbrspc=5: nbr):
+            slip._compute_ref()
+            slip.invalidate_cache(['scan_line'])
+            reference = slip.reference
+            scan_line = slip.scan_line
+        self.assertEqual(reference[:13], '1234567654321')
+        self.assertEqual(len(reference), 27)
+        self.assertIn('>%s+' % reference, scan_line)
+
     def test_isr_reference(self):
         # no partner ref
         self.env.ref('base.res_partner_12').ref = ''
@@ -217,6 +313,264 @@ class TestPaymentSlip(common.SavepointCase):
         self.assertTrue(data)
         self.assertEqual(format_report, 'pdf')
 
+    def test_print_report_to_file(self):
+        invoice1 = self.make_invoice()
+        invoice2 = self.make_invoice()
+        pdfreport = self.report1slip_from_inv._render_reportlab_pdf_file(
+            [invoice1.id, invoice2.id])
+        with pdfreport:
+            data = pdfreport.read()
+        self.assertTrue(data.startswith(b'%PDF'))
+        reader = PyPDF2.PdfFileReader(io.BytesIO(data))
+        self.assertEqual(reader.getNumPages(), 2)
+
+    def test_print_multi_report_single_document(self):
+        invoice1 = self.make_invoice()
+        invoice2 = self.make_invoice()
+        slips = invoice1.slip_ids | invoice2.slip_ids
+        data = slips._draw_payment_slips(
+            a4=True, report_name=self.report1slip_from_inv.report_name)
+        reader = PyPDF2.PdfFileReader(io.BytesIO(data))
+        self.assertEqual(reader.getNumPages(), len(slips))
+
+    def test_print_multi_report_shared_static_form(self):
+        invoice1 = self.make_invoice()
+        invoice2 = self.make_invoice()
+        slips = invoice1.slip_ids | invoice2.slip_ids
+        with mock.patch.object(Canvas, 'beginForm', autospec=True,
+                               side_effect=Canvas.beginForm) as begin_form:
+            data = slips._draw_payment_slips(
+                a4=True, report_name=self.report1slip_from_inv.report_name)
+        # both invoices use the same bank account
+        self.assertEqual(begin_form.call_count, 1)
+        reader = PyPDF2.PdfFileReader(io.BytesIO(data))
+        self.assertEqual(reader.getNumPages(), len(slips))
+
+    def test_render_slips_lang(self):
+        invoice1 = self.make_invoice()
+        invoice2 = self.make_invoice()
+        slips = invoice1.slip_ids | invoice2.slip_ids
+        slips_data = slips._get_slips_data(a4=True)
+        slips_data[0].lang = 'fr_FR'
+        slips_data[1].lang = 'de_DE'
+        print_settings = slips._get_settings(None)
+        langs = []
+        slip_class = type(slips)
+
+        def draw_page(slip, *args, **kwargs):
+            langs.append((slip.id, slip.env.context.get('lang')))
+
+        with mock.patch.object(slip_class, '_draw_payment_slip_page',
+                               autospec=True, side_effect=draw_page):
+            slips._render_slips(slips_data, print_settings, a4=True)
+        self.assertEqual(langs, [(slips_data[0].id, 'fr_FR'),
+                                 (slips_data[1].id, 'de_DE')])
+
+    def test_deprecated_slip_methods(self):
+        invoice = self.make_invoice()
+        slip = invoice.slip_ids
+        slip_model = self.env['l10n_ch.payment_slip']
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            self.assertEqual(
+                slip_model.get_slip_for_move_line(slip.move_line_id), slip)
+            # the existing slip is returned, not a duplicate
+            self.assertEqual(
+                slip_model.create_slip_from_move_line(slip.move_line_id),
+                slip)
+        self.assertEqual(
+            [warning.category for warning in caught],
+            [DeprecationWarning, DeprecationWarning])
+
+    def test_deprecated_invoice_methods(self):
+        invoice = self.make_invoice()
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            self.assertEqual(invoice.get_payment_move_line(),
+                             invoice._get_payment_move_lines())
+        self.assertEqual([warning.category for warning in caught],
+                         [DeprecationWarning])
+        invoice_class = type(invoice)
+        with mock.patch.object(invoice_class,
+                               '_update_ref_on_account_analytic_lines',
+                               autospec=True) as update_lines:
+            invoice._update_ref_on_account_analytic_line(
+                '123', invoice.move_id.id)
+        update_lines.assert_called_once_with(
+            invoice, [('123', invoice.move_id.id)])
+
+    def test_slips_data(self):
+        invoice1 = self.make_invoice()
+        invoice2 = self.make_invoice()
+        slips = invoice1.slip_ids | invoice2.slip_ids
+        slips_data = slips._get_slips_data(a4=True)
+        self.assertEqual([data.id for data in slips_data], slips.ids)
+        for slip, data in zip(slips, slips_data):
+            self.assertEqual(data.reference, slip.reference)
+            self.assertEqual(data.amount_total, 862.50)
+            self.assertEqual(data.scan_line, slip._compute_scan_line_list())
+            self.assertEqual(data.isr_subs_number, '01-1234-1')
+            self.assertEqual(data.bank.name, 'BCV')
+            self.assertEqual(
+                data.partner_address.address_lines,
+                slip._get_address_lines(slip.get_comm_partner().id)
+            )
+            self.assertIn(slip.invoice_id.number, data.description)
+
+    def test_print_multi_report_parallel(self):
+        self.env.user.company_id.slip_render_workers = 2
+        invoice1 = self.make_invoice()
+        invoice2 = self.make_invoice()
+        invoice3 = self.make_invoice()
+        slips = invoice1.slip_ids | invoice2.slip_ids | invoice3.slip_ids
+        slip_class = type(self.env['l10n_ch.payment_slip'])
+        # the tests do not run in a prefork worker, use threads instead
+        # of forked processes
+        thread_context = mock.Mock()
+        thread_context.Pool.side_effect = multiprocessing.dummy.Pool
+        with mock.patch.object(slip_class, '_render_chunk_size', 1), \
+                mock.patch.object(slip_class, '_can_render_in_parallel',
+                                  return_value=True), \
+                mock.patch.object(payment_slip_module.multiprocessing,
+                                  'get_context',
+                                  return_value=thread_context), \
+                mock.patch.object(payment_slip_module.signal, 'signal'):
+            data = slips._draw_payment_slips(
+                a4=True, report_name=self.report1slip_from_inv.report_name)
+        self.assertEqual(thread_context.Pool.call_count, 1)
+        reader = PyPDF2.PdfFileReader(io.BytesIO(data))
+        self.assertEqual(reader.getNumPages(), len(slips))
+
+    def test_print_multi_report_parallel_to_file(self):
+        self.env.user.company_id.slip_render_workers = 2
+        invoice1 = self.make_invoice()
+        invoice2 = self.make_invoice()
+        slips = invoice1.slip_ids | invoice2.slip_ids
+        slip_class = type(self.env['l10n_ch.payment_slip'])
+        thread_context = mock.Mock()
+        thread_context.Pool.side_effect = multiprocessing.dummy.Pool
+        with mock.patch.object(slip_class, '_render_chunk_size', 1), \
+                mock.patch.object(slip_class, '_can_render_in_parallel',
+                                  return_value=True), \
+                mock.patch.object(payment_slip_module.multiprocessing,
+                                  'get_context',
+                                  return_value=thread_context), \
+                mock.patch.object(payment_slip_module.signal, 'signal'), \
+                mock.patch.object(payment_slip_module.os, 'unlink',
+                                  side_effect=os.unlink) as unlink, \
+                io.BytesIO() as output:
+            result = slips._draw_payment_slips(
+                a4=True, report_name=self.report1slip_from_inv.report_name,
+                output=output)
+            self.assertIs(result, output)
+            data = output.getvalue()
+        # the chunks are removed once merged
+        chunks = [call[0][0] for call in unlink.call_args_list
+                  if 'isr_chunk.' in call[0][0]]
+        self.assertEqual(len(chunks), len(slips))
+        for path in chunks:
+            self.assertFalse(os.path.exists(path))
+        reader = PyPDF2.PdfFileReader(io.BytesIO(data))
+        self.assertEqual(reader.getNumPages(), len(slips))
+
+    def test_print_multi_report_parallel_not_worker(self):
+        self.env.user.company_id.slip_render_workers = 2
+        slips = self.make_invoice().slip_ids | self.make_invoice().slip_ids
+        slip_class = type(self.env['l10n_ch.payment_slip'])
+        # tests do not run in a prefork worker: rendered in the current
+        # process
+        with mock.patch.object(slip_class, '_render_chunk_size', 1), \
+                mock.patch.object(slip_class, '_render_slips_parallel',
+                                  autospec=True) as render_parallel:
+            data = slips._draw_payment_slips(
+                a4=True, report_name=self.report1slip_from_inv.report_name)
+        render_parallel.assert_not_called()
+        reader = PyPDF2.PdfFileReader(io.BytesIO(data))
+        self.assertEqual(reader.getNumPages(), len(slips))
+
+    def test_can_render_in_parallel(self):
+        slip_model = self.env['l10n_ch.payment_slip']
+        self.assertFalse(slip_model._can_render_in_parallel())
+        server_module = payment_slip_module.odoo_server
+        # master process of the prefork server
+        master = mock.Mock(spec=server_module.PreforkServer, pid=os.getpid())
+        with mock.patch.object(server_module, 'server', master):
+            self.assertFalse(slip_model._can_render_in_parallel())
+        # worker forked from the master
+        master.pid = os.getppid()
+        with mock.patch.object(server_module, 'server', master):
+            self.assertTrue(slip_model._can_render_in_parallel())
+        threaded = mock.Mock(spec=server_module.ThreadedServer)
+        with mock.patch.object(server_module, 'server', threaded):
+            self.assertFalse(slip_model._can_render_in_parallel())
+
+    def test_register_fonts_once(self):
+        slip_model = self.env['l10n_ch.payment_slip']
+        slip_model._register_fonts()
+        with mock.patch(
+            'odoo.addons.l10n_ch_payment_slip.models.payment_slip.TTFont'
+        ) as ttfont:
+            slip_model._register_fonts()
+            slip_model._register_fonts()
+        ttfont.assert_not_called()
+
+    def test_render_cache(self):
+        self.env['ir.config_parameter'].sudo().set_param(
+            'isr.render.cache.size', '100')
+        invoice = self.make_invoice()
+        slip = invoice.slip_ids
+        pdf = slip._draw_payment_slip(a4=True)
+        slip_class = type(slip)
+        with mock.patch.object(slip_class, '_render_slips',
+                               autospec=True) as render_slips:
+            self.assertEqual(slip._draw_payment_slip(a4=True), pdf)
+        render_slips.assert_not_called()
+        with mock.patch.object(slip_class, '_render_slips',
+                               autospec=True) as render_slips:
+            self.assertEqual(slip._draw_payment_slips(a4=True), pdf)
+        render_slips.assert_not_called()
+        print_settings = slip._get_settings(None)
+        slip_data = slip._get_slips_data(a4=True)[0]
+        key = slip._get_render_cache_key(slip_data, print_settings, True)
+        versions = slip._get_module_versions()
+        self.assertIn('l10n_ch_payment_slip', dict(versions))
+        with mock.patch.object(
+                slip_class, '_get_module_versions', autospec=True,
+                return_value=versions + (('l10n_ch_custom_slip', '1.0'),)):
+            self.assertNotEqual(
+                key,
+                slip._get_render_cache_key(slip_data, print_settings, True))
+        slip_data.amount_total += 1
+        self.assertNotEqual(
+            key, slip._get_render_cache_key(slip_data, print_settings, True))
+
+    def test_render_cache_disabled(self):
+        slip_model = self.env['l10n_ch.payment_slip']
+        self.assertIsNone(slip_model._get_render_cache())
+
+    def test_render_cache_failed_write(self):
+        with tempfile.TemporaryDirectory() as path:
+            cache = SlipRenderCache(path, 25)
+            with mock.patch.object(slip_render_cache.os, 'replace',
+                                   side_effect=OSError):
+                cache.set('aa01', b'x' * 10)
+            self.assertIsNone(cache.get('aa01'))
+            # the temporary file is removed
+            self.assertEqual(os.listdir(os.path.join(path, 'aa')), [])
+
+    def test_render_cache_eviction(self):
+        with tempfile.TemporaryDirectory() as path:
+            cache = SlipRenderCache(path, 25)
+            cache.set('aa01', b'x' * 10)
+            cache.set('aa02', b'x' * 10)
+            # make the first document the least recently used one
+            os.utime(cache._file_path('aa01'), (0, 0))
+            cache.set('aa03', b'x' * 10)
+            cache.evict(force=True)
+            self.assertIsNone(cache.get('aa01'))
+            self.assertEqual(cache.get('aa02'), b'x' * 10)
+            self.assertEqual(cache.get('aa03'), b'x' * 10)
+
     def test_address_format(self):
         invoice = self.make_invoice()
         self.assertTrue(invoice.move_id)
@@ -319,6 +673,31 @@ class TestPaymentSlip(common.SavepointCase):
         self.assertEqual(isr['report_file'],
                          'l10n_ch_payment_slip.one_slip_per_page')
 
+    def test_print_in_background(self):
+        invoice1 = self.make_invoice()
+        invoice2 = self.make_invoice()
+        job = self.env['isr.batch.print.job'].create_from_invoices(
+            invoice1 | invoice2)
+        job.chunk_size = 1
+        self.assertEqual(job.chunk_count, 2)
+        self.assertEqual(job.progress, 0.0)
+        # simulate a job interrupted after its first chunk
+        job._render_chunk(0, job._get_chunks()[0])
+        self.assertEqual(job.done_chunk_count, 1)
+        job_class = type(job)
+        with mock.patch.object(self.env.cr, 'commit'), \
+                mock.patch.object(job_class, '_render_chunk', autospec=True,
+                                  side_effect=job_class._render_chunk
+                                  ) as render_chunk:
+            job._cron_process_jobs()
+        self.assertEqual(render_chunk.call_count, 1)
+        self.assertEqual(job.state, 'done')
+        self.assertEqual(job.progress, 100.0)
+        self.assertFalse(job._get_chunk_attachments())
+        data = base64.b64decode(job.attachment_id.datas)
+        reader = PyPDF2.PdfFileReader(io.BytesIO(data))
+        self.assertEqual(reader.getNumPages(), 2)
+
     def test_reload_from_attachment(self):
 
         def _find_invoice_attachment(self, invoice):
@@ -0,0 +1,81 @@
+# Copyright 2019 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+"""Computation of ISR references and scan lines
+
+Works on plain values only, see :py:class:`IsrRow`, so the values of
+many slips are read at once before their references and scan lines are
+computed. The payment slip model builds the rows with its hooks
+(`_get_isrb_id_number`, `_get_partner_number`) and gives its own check
+digit function.
+"""
+import re
+from collections import namedtuple
+
+from odoo.addons.l10n_ch_base_bank.tools.checksum import mod10r
+
+REFERENCE_SIZE = 26  # without control digit
+
+IsrRow = namedtuple('IsrRow', (
+    'id_number',       # ISR-B customer ID number, may be empty
+    'partner_number',  # partner number, filled by 0 on the left
+    'invoice_number',  # number of the invoice, may be empty
+    'line_id',         # id of the move line
+    'amount',          # amount of the slip
+    'subscription',    # ISR subscription number formatted for scan line
+))
+
+_non_digits = re.compile(r'\D')
+
+
+def compute_reference(row, checksum=mod10r):
+    """Return the ISR reference of a slip, without spaces
+
+    :param row: values of the slip
+    :type row: :py:class:`IsrRow`
+
+    :param checksum: function appending the control digit
+    :type checksum: callable
+
+    :rtype: str
+    """
+    id_number = row.id_number or ''
+    move_number = str(row.line_id)
+    if row.invoice_number:
+        move_number = _non_digits.sub('', row.invoice_number + move_number)
+    # take only last digits of move if it exceed boundaries
+    move_size = REFERENCE_SIZE - len(id_number) - len(row.partner_number)
+    extra = len(move_number) - move_size
+    if extra > 0:
+        move_number = move_number[extra:]
+    move_number = move_number.rjust(move_size, '0')
+    return checksum(id_number + row.partner_number + move_number)
+
+
+def compute_scan_line(row, reference, checksum=mod10r):
+    """Return the scan line of a slip
+
+    :param row: values of the slip
+    :type row: :py:class:`IsrRow`
+
+    :param reference: ISR reference, spaces are ignored
+    :type reference: str
+
+    :param checksum: function appending the control digit
+    :type checksum: callable
+
+    :rtype: str
+    """
+    justified_amount = '01%s' % ('%.2f' % row.amount).replace(
+        '.', '').rjust(10, '0')
+    return '%s>%s+ %s>' % (checksum(justified_amount),
+                           reference.replace(' ', ''),
+                           row.subscription)
+
+
+def space_reference(reference, group_size=5):
+    """Space a reference by groups of digits
+
+    Example: '123456789012345' -> '12 34567 89012 345'
+    """
+    return ''.join([' '[(i - 2) % group_size:] + c
+                    for i, c in enumerate(reference)])
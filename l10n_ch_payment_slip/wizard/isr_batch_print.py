@@ -39,3 +39,17 @@ class ISRBatchPrintWizard(models.TransientModel):
             return self.invoice_ids.print_isr()
         else:
             return {'type': 'ir.actions.act_window_close'}
+
+    @api.multi
+    def print_payment_slips_in_background(self):
+        if not self.invoice_ids:
+            return {'type': 'ir.actions.act_window_close'}
+        job = self.env['isr.batch.print.job'].create_from_invoices(
+            self.invoice_ids)
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': job._name,
+            'res_id': job.id,
+            'view_mode': 'form',
+            'target': 'current',
+        }